@@ -19,10 +19,18 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'liontechweb.settings')
 
 django_asgi_app = get_asgi_application()
 
+from django.conf import settings
+
+if settings.JOBS_IN_PROCESS:
+	from website import jobs
+	jobs.start_in_process_worker()
+
 import website.routing
+from website.media import MediaFilesApp
 
 application = ProtocolTypeRouter({
-	"http": django_asgi_app,
+	# /media/ is answered before Django (ranged, conditional, mmap/zero-copy)
+	"http": MediaFilesApp(django_asgi_app),
 	"websocket": AuthMiddlewareStack(
 		URLRouter(
 			website.routing.websocket_urlpatterns
@@ -3,6 +3,7 @@ Django settings for liontechweb project.
 Corrected for local development and Render deployment.
 """
 
+import importlib.util
 import os
 from pathlib import Path
 
@@ -55,9 +56,9 @@ INSTALLED_APPS = [
 
 # MIDDLEWARE
 MIDDLEWARE = [
-    'website.middleware.SqlitePragmaMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'website.db_router.replica_pinning',
+    'website.static.AsyncWhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -76,13 +77,23 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # Compile each template once per process. home.html is split into
+            # ~15 includes, so re-reading them on every request adds up.
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ] if not DEBUG else [
+                'django.template.loaders.filesystem.Loader',
+                'django.template.loaders.app_directories.Loader',
+            ],
         },
     },
 ]
@@ -103,15 +114,51 @@ if REDIS_URL:
 else:
     CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
 
+# CACHE
+# Shared Redis cache when available, otherwise a per-process local-memory cache.
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'liontech',
+        }
+    }
+
+# Seconds a cached catalog API response lives. Product/Bundle writes invalidate
+# entries immediately; the timeout only bounds staleness across processes when
+# the cache is not shared (local memory).
+CATALOG_CACHE_TIMEOUT = int(os.environ.get('CATALOG_CACHE_TIMEOUT', '300' if REDIS_URL else '60'))
+
+# Seconds a cached section of the storefront page ({% cache %} in home.html)
+# lives. Keys include the catalog version and the visitor's cart/order stamps,
+# so writes show up immediately; this only bounds how long unused entries stay.
+HOME_FRAGMENT_TIMEOUT = int(os.environ.get('HOME_FRAGMENT_TIMEOUT', str(CATALOG_CACHE_TIMEOUT)))
+
 # DATABASE
+# website.backends.sqlite3 is Django's SQLite backend with one writer per
+# process: transactions queue for the write lock and begin IMMEDIATE
+# (see website/sqlite.py).
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'website.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-        'OPTIONS': {'timeout': 20},
+        'OPTIONS': {'timeout': 20, 'transaction_mode': 'IMMEDIATE'},
     }
 }
 
+# Pragmas applied to every new SQLite connection (see website/sqlite.py):
+# 'fast' (WAL, synchronous=NORMAL), 'durable' (fsync each commit) or 'none'.
+# SQLITE_PRAGMAS overrides single values, e.g. {'mmap_size': 0}.
+SQLITE_PRAGMA_PROFILE = os.environ.get('SQLITE_PRAGMA_PROFILE', 'fast')
+SQLITE_PRAGMAS = {}
+
 if os.environ.get('DATABASE_URL'):
     try:
         import dj_database_url
@@ -119,6 +166,65 @@ if os.environ.get('DATABASE_URL'):
     except Exception as e:
         print(f"⚠️ Failed to parse DATABASE_URL: {e}")
 
+# READ REPLICAS
+# Product and bundle reads go to these aliases (website/db_router.py).
+# DATABASE_REPLICA_URLS takes comma-separated URLs of read-only copies of the
+# primary. With SQLite, SQLITE_READ_REPLICA=1 opens the same file read-only.
+# It is off by default, deploy included: WAL readers never block the writer
+# anyway, so turn it on only once a benchmark shows a gain. Tests also cannot
+# see a TestCase's uncommitted rows through a second connection.
+DATABASE_REPLICAS = []
+_replica_urls = [u.strip() for u in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if u.strip()]
+if _replica_urls:
+    try:
+        import dj_database_url
+        for n, url in enumerate(_replica_urls, 1):
+            DATABASES[f'replica{n}'] = dict(dj_database_url.parse(url), TEST={'MIRROR': 'default'})
+            DATABASE_REPLICAS.append(f'replica{n}')
+    except Exception as e:
+        print(f"⚠️ Failed to parse DATABASE_REPLICA_URLS: {e}")
+elif (DATABASES['default']['ENGINE'] == 'website.backends.sqlite3'
+      and os.environ.get('SQLITE_READ_REPLICA', '0').lower() in ('1', 'true', 'yes')):
+    DATABASES['replica'] = {
+        'ENGINE': 'website.backends.sqlite3',
+        'NAME': Path(DATABASES['default']['NAME']).as_uri() + '?mode=ro',
+        'OPTIONS': {'timeout': 20},
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append('replica')
+
+# CONNECTION REUSE
+# Under uvicorn each request runs its sync code on a new thread, and Django
+# connections belong to a thread. So CONN_MAX_AGE only reuses connections
+# under WSGI; under ASGI a pool is what avoids a connect per request:
+# - SQLite: website.backends.sqlite3 keeps up to SQLITE_POOL_SIZE idle
+#   connections.
+# - PostgreSQL: psycopg's pool (DB_POOL, needs psycopg[pool]); otherwise
+#   persistent connections with health checks.
+# /api/db-stats/ shows new connections per request for each worker.
+_pool_available = importlib.util.find_spec('psycopg_pool') is not None
+for _db in DATABASES.values():
+    if _db['ENGINE'] == 'website.backends.sqlite3':
+        _db['OPTIONS']['pool'] = {'max_size': int(os.environ.get('SQLITE_POOL_SIZE', '8'))}
+        _db['CONN_MAX_AGE'] = 0
+    elif 'postgresql' in _db['ENGINE']:
+        _db['CONN_HEALTH_CHECKS'] = True
+        if _pool_available and os.environ.get('DB_POOL', '1').lower() in ('1', 'true', 'yes'):
+            _db.setdefault('OPTIONS', {})['pool'] = {
+                'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+                'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '10')),
+                'timeout': int(os.environ.get('DB_POOL_TIMEOUT', '10')),
+            }
+            # Django's pool requires this; closing hands the connection back
+            _db['CONN_MAX_AGE'] = 0
+        else:
+            _db['CONN_MAX_AGE'] = int(os.environ.get('CONN_MAX_AGE', '60'))
+
+DATABASE_ROUTERS = ['website.db_router.CatalogReplicaRouter']
+# After a catalog write, this client reads from default for this many seconds
+REPLICA_PIN_COOKIE = 'primary_pin'
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', '5'))
+
 # PASSWORD VALIDATION
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -130,9 +236,31 @@ AUTH_PASSWORD_VALIDATORS = [
 # REST FRAMEWORK
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 6
+    'PAGE_SIZE': 6,
+    'DEFAULT_RENDERER_CLASSES': [
+        'website.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
+# BACKGROUND JOBS (website/jobs.py)
+# Image processing runs in a daemon thread of each web process. The deploy is
+# one web service that owns the SQLite file, so a separate worker service
+# could not share the database. Set JOBS_IN_PROCESS=0 only when a
+# `manage.py run_jobs` worker drains the queue instead. That worker needs the
+# same database and MEDIA_ROOT (with SQLite: the same disk) and a shared cache
+# (REDIS_URL).
+JOBS_IN_PROCESS = os.environ.get('JOBS_IN_PROCESS', '1').lower() in ('1', 'true', 'yes')
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', '2'))
+
+# ASYNC API VIEWS
+# 1 serves the polled read endpoints (cart, orders, products, product detail,
+# live search) from website.async_views, so under ASGI they don't each hold a
+# worker thread. Off by default: the DRF views in website.views stay the
+# reference until the async ones have been load tested in production
+# (manage.py load_test_api).
+ASYNC_API_VIEWS = os.environ.get('ASYNC_API_VIEWS', '0').lower() in ('1', 'true', 'yes')
+
 # INTERNATIONALIZATION
 LANGUAGE_CODE = 'en-us'
 TIME_ZONE = 'UTC'
@@ -147,6 +275,12 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Browser cache lifetime for media outside the content-addressed blobs/ store (see website/media.py)
+MEDIA_CACHE_MAX_AGE = int(os.environ.get('MEDIA_CACHE_MAX_AGE', '3600'))
+
+# Resized copies written next to each product/bundle upload (see website/images.py)
+IMAGE_DERIVATIVE_WIDTHS = (320, 640, 960)
+IMAGE_DERIVATIVE_FORMATS = ('avif', 'webp', 'jpeg')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
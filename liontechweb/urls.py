@@ -1,9 +1,12 @@
 
+import re
+
 from django.contrib import admin
 from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
-from django.views.static import serve as static_serve
+
+from website.media import serve_media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -14,10 +17,8 @@ if settings.DEBUG:
     # Serve static files in debug mode
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
 
-# Always add media serving for local development (helps when some tooling toggles DEBUG)
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-
-# Explicit fallback to serve media files even when DEBUG is False (development only)
+# Media for WSGI and runserver. Under ASGI, MediaFilesApp (asgi.py) answers
+# these requests before they reach Django.
 urlpatterns += [
-    re_path(r'^media/(?P<path>.*)$', static_serve, {'document_root': settings.MEDIA_ROOT}),
+    re_path(r'^%s(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')), serve_media),
 ]
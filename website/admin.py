@@ -1,5 +1,11 @@
 # app/admin.py
 from django.contrib import admin
-from .models import Product
+from .models import Product, Job
 
 admin.site.register(Product)
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'attempts', 'run_after', 'updated_at')
+    list_filter = ('status', 'kind')
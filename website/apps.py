@@ -1,7 +1,6 @@
 from django.apps import AppConfig
-from django.db import connections
-from django.db.utils import OperationalError
-import logging
+from django.core.signals import request_finished
+from django.db.backends.signals import connection_created
 
 
 class WebsiteConfig(AppConfig):
@@ -14,27 +13,11 @@ class WebsiteConfig(AppConfig):
             from . import signals  # noqa: F401
         except Exception:
             pass
-        # Ensure SQLite uses WAL journal mode and a reasonable busy timeout to reduce
-        # "database is locked" errors during concurrent access in development.
-        # This is best-effort and non-fatal if it fails.
-        try:
-            logger = logging.getLogger(__name__)
-            conn = connections['default']
-            # Only apply for sqlite backend
-            if conn.settings_dict.get('ENGINE', '').endswith('sqlite3'):
-                cursor = conn.cursor()
-                try:
-                    cursor.execute('PRAGMA journal_mode=WAL;')
-                    cursor.execute('PRAGMA busy_timeout=20000;')
-                    logger.info('Enabled SQLite WAL and busy_timeout')
-                finally:
-                    try:
-                        cursor.close()
-                    except Exception:
-                        pass
-        except OperationalError:
-            # DB might not exist yet during migrations; ignore
-            pass
-        except Exception:
-            # Non-fatal; log and continue
-            logging.exception('Failed to set SQLite pragmas in ready()')
+        # Tune every SQLite connection as it opens (WAL, busy timeout, page
+        # cache...), not just the first one. See website/sqlite.py.
+        from .sqlite import configure_connection
+        connection_created.connect(configure_connection, dispatch_uid='website.sqlite.configure_connection')
+        # Connection reuse counters for /api/db-stats/
+        from . import db_metrics
+        connection_created.connect(db_metrics.connection_opened, dispatch_uid='website.db_metrics.connection_opened')
+        request_finished.connect(db_metrics.request_finished, dispatch_uid='website.db_metrics.request_finished')
@@ -0,0 +1,109 @@
+"""Async versions of the polled read-only JSON endpoints.
+
+Under ASGI a sync view holds a worker thread for the whole request. While the
+storefront polls the cart, product and order endpoints every few seconds
+those threads become the limit, long before the CPU or the database is. These
+views run on the event loop: the ORM and cache calls are awaited and only
+they leave the loop. Serializing is pure CPU: image srcsets come from the
+rows' ``derived_images``, so nothing here asks the storage. Keep it that
+way, since a blocking call here stalls every request on the loop.
+``ASYNC_API_VIEWS`` (off by default) chooses these or the DRF views in
+``views`` in ``urls.py``. Both must return the same JSON, ETags and status
+codes.
+
+They are plain Django views, so DRF's browsable API and ``?format=`` don't
+apply. ``api_errors`` turns the DRF exceptions raised by the shared helpers
+(``requested_fields``, ``requested_cursor``) into the same responses.
+"""
+import functools
+
+from django.http import JsonResponse
+from django.views.decorators.http import require_safe
+from rest_framework.exceptions import APIException
+
+from .cart import acart_queryset, cart_payload, get_session_key, with_line_totals
+from .catalog_cache import cache_catalog_response
+from .etags import aproducts_etag, aproduct_detail_etag, acart_etag, conditional
+from .fast_serializers import FastProductSerializer
+from .models import Product, Order
+from .pagination import apaginate, aestimated_total, page_body, requested_cursor, wants_total
+from .renderers import JSONResponse
+from .serializers import ProductSerializer, OrderSerializer, requested_fields, product_queryset
+from . import search
+
+
+def api_errors(view):
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            return await view(request, *args, **kwargs)
+        except APIException as exc:
+            return JSONResponse(exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail},
+                                status=exc.status_code)
+    return wrapper
+
+
+@require_safe
+@api_errors
+@cache_catalog_response('live_search')
+async def live_search_products(request):
+    query = request.GET.get('search', '')
+    fast = FastProductSerializer(request, requested_fields(request, ProductSerializer))
+    products = Product.objects.all()
+    if query:
+        products = await search.afilter_products(products, query)
+    return JSONResponse(fast.serialize([row async for row in fast.values(products)]))
+
+
+@require_safe
+async def get_orders(request):
+    # Scope orders to authenticated user or session
+    user = await request.auser()
+    if user.is_authenticated:
+        orders = Order.objects.filter(owner=user).order_by('-date')
+    else:
+        session_key = get_session_key(request)
+        orders = Order.objects.filter(session_key=session_key).order_by('-date') if session_key else Order.objects.none()
+    orders = [order async for order in orders]
+    return JSONResponse(OrderSerializer(orders, many=True, context={'request': request}).data)
+
+
+@conditional(aproducts_etag)
+@require_safe
+@api_errors
+@cache_catalog_response('products')
+async def get_products(request):
+    fast = FastProductSerializer(request, requested_fields(request, ProductSerializer))
+    products = fast.values(Product.objects.all())
+    page = await apaginate(products, requested_cursor(request))
+    if wants_total(request):
+        page.estimated_total = await aestimated_total(products, f'api:{Product._meta.label_lower}')
+    return JSONResponse(page_body(request, page, fast.serialize(page)))
+
+
+@conditional(aproduct_detail_etag)
+@require_safe
+@api_errors
+@cache_catalog_response('product_detail')
+async def get_product_detail(request, pk):
+    fields = requested_fields(request, ProductSerializer)
+    try:
+        # category is needed below for the related products
+        product = await product_queryset(fields, extra=('category',)).aget(pk=pk)
+    except Product.DoesNotExist:
+        return JSONResponse({'detail': 'Not found'}, status=404)
+
+    related = [p async for p in product_queryset(fields).filter(category=product.category).exclude(id=product.id)[:4]]
+    product_data = ProductSerializer(product, fields=fields, context={'request': request}).data
+    related_data = ProductSerializer(related, many=True, fields=fields, context={'request': request}).data
+    return JSONResponse({'product': product_data, 'related': related_data})
+
+
+@conditional(acart_etag, private=True)
+async def cart_api(request):
+    # Scope cart items to current user or session
+    user = await request.auser()
+    if not user.is_authenticated and not request.session.session_key:
+        await request.session.asave()
+    cart = await acart_queryset(request)
+    return JsonResponse(cart_payload(request, [item async for item in with_line_totals(cart)]))
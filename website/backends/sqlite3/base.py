@@ -0,0 +1,82 @@
+"""SQLite backend with a write queue and an optional connection pool.
+
+Use it as ``'ENGINE': 'website.backends.sqlite3'`` with, in ``OPTIONS``:
+
+- ``'transaction_mode': 'IMMEDIATE'``: transactions go through the process's
+  write queue.
+- ``'pool': True`` or ``{'max_size': n}``: closed connections are kept for
+  reuse, like the PostgreSQL backend's ``pool`` option.
+
+See ``website.sqlite``.
+"""
+from django.db.backends.sqlite3 import base
+
+from website.sqlite import close_connection_pool, connection_pool, write_queue
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    _write_token = None
+    # True while the open connection came from the pool (already configured)
+    reused_connection = False
+
+    @property
+    def write_queue(self):
+        return write_queue(self.settings_dict['NAME'])
+
+    @property
+    def pool(self):
+        options = self.settings_dict['OPTIONS'].get('pool')
+        if not options or self.is_in_memory_db():
+            return None
+        return connection_pool(self.settings_dict['NAME'], options)
+
+    def close_pool(self):
+        close_connection_pool(self.settings_dict['NAME'])
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pool', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        conn = pool.get() if pool is not None else None
+        self.reused_connection = conn is not None
+        return conn if conn is not None else super().get_new_connection(conn_params)
+
+    def _start_transaction_under_autocommit(self):
+        # Same wait as the sqlite3 "timeout" option gives a locked database
+        timeout = self.settings_dict['OPTIONS'].get('timeout', 5)
+        self._write_token = self.write_queue.acquire(timeout)
+        try:
+            super()._start_transaction_under_autocommit()
+        except BaseException:
+            self._release_write_slot()
+            raise
+
+    def _release_write_slot(self):
+        if self._write_token is not None:
+            self.write_queue.release(self._write_token)
+            self._write_token = None
+
+    def _commit(self):
+        result = super()._commit()
+        # A failed COMMIT leaves the transaction open until the rollback
+        self._release_write_slot()
+        return result
+
+    def _rollback(self):
+        try:
+            return super()._rollback()
+        finally:
+            self._release_write_slot()
+
+    def _close(self):
+        try:
+            pool = self.pool
+            if pool is not None and self.connection is not None and not self.errors_occurred:
+                if pool.put(self.connection):
+                    return None
+            return super()._close()
+        finally:
+            self._release_write_slot()
@@ -0,0 +1,124 @@
+"""Cart scoping and totals.
+
+Every view that shows or mutates the cart needs the same two things: the
+visitor's ``cartOrder`` rows (scoped to the logged-in user or the session) and
+the subtotal / tax / item count for them. Totals are computed in the database
+with a single aggregate query, and the tax math lives here only.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.db.models import Sum, F, DecimalField, ExpressionWrapper
+
+from .models import cartOrder
+
+# Tax is added on top of the listed prices
+TAX_RATE = Decimal('0.15')
+
+CENTS = Decimal('0.01')
+
+
+def get_session_key(request, create=False):
+    """Return the visitor's session key, optionally creating a session."""
+    try:
+        session_key = request.session.session_key
+    except Exception:
+        return None
+    if not session_key and create:
+        try:
+            request.session.create()
+            session_key = request.session.session_key
+        except Exception:
+            session_key = None
+    return session_key
+
+
+def _cart_rows(request, user, create_session=False):
+    if user and user.is_authenticated:
+        return cartOrder.objects.filter(owner=user)
+    session_key = get_session_key(request, create=create_session)
+    if not session_key:
+        return cartOrder.objects.none()
+    return cartOrder.objects.filter(session_key=session_key)
+
+
+def cart_queryset(request, create_session=False):
+    """Return the cart rows belonging to the current user or session."""
+    return _cart_rows(request, request.user, create_session)
+
+
+async def acart_queryset(request):
+    """``cart_queryset()`` for async views. Never creates a session."""
+    return _cart_rows(request, await request.auser())
+
+
+def with_line_totals(queryset):
+    return queryset.annotate(
+        total_price=ExpressionWrapper(F('price') * F('quantity'), output_field=DecimalField())
+    )
+
+
+def _totals(subtotal, total_items):
+    subtotal = (subtotal or Decimal('0')).quantize(CENTS, rounding=ROUND_HALF_UP)
+    taxes = (subtotal * TAX_RATE).quantize(CENTS, rounding=ROUND_HALF_UP)
+    return {
+        'subtotal': subtotal,
+        'taxes': taxes,
+        'total': subtotal + taxes,
+        'total_items': total_items or 0,
+    }
+
+
+def cart_totals(queryset):
+    """Subtotal, taxes, total and item count for a cart queryset, in one query."""
+    agg = queryset.aggregate(
+        subtotal=Sum(F('price') * F('quantity'), output_field=DecimalField(max_digits=12, decimal_places=2)),
+        total_items=Sum('quantity'),
+    )
+    return _totals(agg['subtotal'], agg['total_items'])
+
+
+def totals_from_items(items):
+    """Same as cart_totals() for cart rows that are already loaded."""
+    subtotal = sum((item.price * item.quantity for item in items), Decimal('0'))
+    return _totals(subtotal, sum(item.quantity for item in items))
+
+
+def format_totals(totals):
+    """String versions of the money fields, as the JSON endpoints return them."""
+    return {key: f"{totals[key]:.2f}" for key in ('subtotal', 'taxes', 'total')}
+
+
+def _image_url(request, image):
+    # Build an absolute URL for the image when possible so front-end can use it directly
+    try:
+        if image:
+            if image.startswith('http://') or image.startswith('https://'):
+                return image
+            # image is stored as a media-relative path like 'products/123.jpg'
+            media_prefix = settings.MEDIA_URL if getattr(settings, 'MEDIA_URL', '/') else '/media/'
+            return request.build_absolute_uri('/' + media_prefix.lstrip('/') + image.lstrip('/'))
+    except Exception:
+        return image or ''
+    return ''
+
+
+def cart_payload(request, cart_items):
+    """The ``/api/cart/`` body for rows from ``with_line_totals()``."""
+    items_list = [{
+        'product_id': item.product_id,
+        'name': item.name,
+        'quantity': item.quantity,
+        'price': float(item.price),
+        'total_price': float(item.total_price),
+        'image': _image_url(request, item.image),
+        'condition': item.condition or '',
+        'category': item.category or '',
+    } for item in cart_items]
+    # Same tax math as the other cart endpoints (tax added on top of prices)
+    totals = totals_from_items(cart_items)
+    return {
+        'cart_items': items_list,
+        **format_totals(totals),
+        'total_items': totals['total_items'],
+    }
@@ -0,0 +1,178 @@
+"""Response caching for the read-only catalog APIs.
+
+Cached entries are keyed by the endpoint, the full request URL (serializers
+build absolute image URLs, so host and scheme matter) and a catalog version
+number. Product and Bundle save/delete signals call ``bump_version()``, which
+makes every older entry unreachable. We never have to find and delete
+individual keys.
+
+The version lives in the cache, so a bump only reaches the processes sharing
+that cache. With the default local-memory cache, a write made by another
+process (``manage.py run_jobs`` or a media command) shows up only when the
+entries time out (``CATALOG_CACHE_TIMEOUT``). ``is_shared()`` tells commands
+whether their bump will be seen.
+
+The ``a``-prefixed functions are for async views.
+"""
+import functools
+import hashlib
+import logging
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from rest_framework.response import Response
+
+from .renderers import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'catalog:version'
+
+
+def _or_none(message):
+    """Log ``message`` and return None when the (sync or async) function raises: the cache is optional."""
+    def decorator(func):
+        if iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                try:
+                    return await func(*args, **kwargs)
+                except Exception:
+                    logger.exception(message, *args[:1])
+                    return None
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                logger.exception(message, *args[:1])
+                return None
+        return wrapper
+    return decorator
+
+
+# The ``a`` twins below differ from the sync functions only by their awaits.
+
+@_or_none('Failed to read catalog cache version')
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, timeout=None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+@_or_none('Failed to read catalog cache version')
+async def aget_version():
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        await cache.aadd(VERSION_KEY, 1, timeout=None)
+        version = await cache.aget(VERSION_KEY, 1)
+    return version
+
+
+@_or_none('Failed to read %s from the cache')
+def cache_get(key):
+    return cache.get(key)
+
+
+@_or_none('Failed to read %s from the cache')
+async def acache_get(key):
+    return await cache.aget(key)
+
+
+@_or_none('Failed to cache %s')
+def cache_set(key, value, timeout=None):
+    cache.set(key, value, catalog_timeout(timeout))
+
+
+@_or_none('Failed to cache %s')
+async def acache_set(key, value, timeout=None):
+    await cache.aset(key, value, catalog_timeout(timeout))
+
+
+def catalog_timeout(timeout=None):
+    return timeout or getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
+
+
+def bump_version():
+    """Invalidate every cached catalog response."""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # key missing (evicted or never set); any new value invalidates old entries
+        cache.add(VERSION_KEY, 2, timeout=None)
+    except Exception:
+        logger.exception('Failed to bump catalog cache version')
+
+
+LOCAL_CACHE_WARNING = ('The web processes use their own local-memory cache: they show these changes '
+                       'once cached entries expire (CATALOG_CACHE_TIMEOUT) or after a restart.')
+
+
+def is_shared():
+    """True if other processes read the same cache (and so see ``bump_version()``)."""
+    return not isinstance(caches['default'], LocMemCache)
+
+
+def bump_version_on_commit(using=None):
+    """Bump once the write is visible, so a concurrent read can't re-cache stale rows."""
+    transaction.on_commit(bump_version, using=using)
+
+
+def cache_key(name, request, version, **kwargs):
+    raw = '|'.join([request.build_absolute_uri(), repr(sorted(kwargs.items()))])
+    digest = hashlib.md5(raw.encode('utf-8')).hexdigest()
+    return f'catalog:{version}:{name}:{digest}'
+
+
+def cache_catalog_response(name, timeout=None):
+    """Cache successful GET responses of a DRF function view, or of an async view returning ``JSONResponse``.
+
+    Use below ``@api_view``. Other methods and non-200 responses pass through.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            return _async_cache(view, name, timeout)
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            version = get_version() if request.method == 'GET' else None
+            if version is None:
+                return view(request, *args, **kwargs)
+            key = cache_key(name, request, version, **kwargs)
+            data = cache_get(key)
+            if data is not None:
+                return Response(data)
+            response = view(request, *args, **kwargs)
+            if _cacheable(response):
+                cache_set(key, response.data, timeout)
+            return response
+        return wrapper
+    return decorator
+
+
+def _cacheable(response):
+    return getattr(response, 'status_code', None) == 200 and hasattr(response, 'data')
+
+
+def _async_cache(view, name, timeout):
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        version = await aget_version() if request.method == 'GET' else None
+        if version is None:
+            return await view(request, *args, **kwargs)
+        key = cache_key(name, request, version, **kwargs)
+        data = await acache_get(key)
+        if data is not None:
+            return JSONResponse(data)
+        response = await view(request, *args, **kwargs)
+        if _cacheable(response):
+            await acache_set(key, response.data, timeout)
+        return response
+    return wrapper
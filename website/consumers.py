@@ -1,18 +1,108 @@
+import asyncio
 import json
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 
+from .models import Order
+from .outbox import outbox
+from . import topics
+
 
 class UpdatesConsumer(AsyncWebsocketConsumer):
+    """Realtime updates, scoped by topic.
+
+    Clients manage their subscriptions by sending
+    ``{"action": "subscribe" | "unsubscribe", "topics": [...]}``, where a
+    topic is ``catalog``, ``cart``, ``orders`` or ``order:<id>``. ``cart`` and
+    ``orders`` always resolve to the connection's own user or session, so a
+    client can never listen to somebody else's cart.
+    """
+    # Subscribed on connect so clients that never send a subscribe message keep working
+    default_topics = ('catalog', 'cart', 'orders')
+
     async def connect(self):
-        self.group_name = 'site_updates'
-        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        # Let the outbox deliver on this (the server's) event loop
+        outbox.bind_loop(asyncio.get_running_loop())
+        self.subscriptions = {}
         await self.accept()
+        await self.subscribe(self.default_topics)
 
     async def disconnect(self, close_code):
+        for group in set(getattr(self, 'subscriptions', {}).values()):
+            try:
+                await self.channel_layer.group_discard(group, self.channel_name)
+            except Exception:
+                pass
+
+    async def receive(self, text_data=None, bytes_data=None):
         try:
-            await self.channel_layer.group_discard(self.group_name, self.channel_name)
-        except Exception:
-            pass
+            message = json.loads(text_data or '{}')
+        except ValueError:
+            return
+        if not isinstance(message, dict):
+            return
+        requested = message.get('topics') or []
+        if isinstance(requested, str):
+            requested = [requested]
+
+        action = message.get('action')
+        if action == 'subscribe':
+            await self.subscribe(requested)
+        elif action == 'unsubscribe':
+            await self.unsubscribe(requested)
+        else:
+            return
+        await self.send(text_data=json.dumps({'type': 'subscriptions', 'topics': sorted(self.subscriptions)}))
+
+    async def subscribe(self, requested):
+        for topic in requested:
+            if topic in self.subscriptions:
+                continue
+            group = await self.resolve_topic(topic)
+            if group:
+                self.subscriptions[topic] = group
+                await self.channel_layer.group_add(group, self.channel_name)
+
+    async def unsubscribe(self, requested):
+        for topic in requested:
+            group = self.subscriptions.pop(topic, None)
+            if group and group not in self.subscriptions.values():
+                await self.channel_layer.group_discard(group, self.channel_name)
+
+    def _visitor(self):
+        user = self.scope.get('user')
+        owner_id = user.pk if user is not None and user.is_authenticated else None
+        session = self.scope.get('session')
+        session_key = getattr(session, 'session_key', None) if session is not None else None
+        return owner_id, session_key
+
+    async def resolve_topic(self, topic):
+        """Map a client topic to a group name, or None if it isn't allowed."""
+        if not isinstance(topic, str):
+            return None
+        owner_id, session_key = self._visitor()
+        if topic == 'catalog':
+            return topics.CATALOG_GROUP
+        if topic == 'cart':
+            return topics.cart_group(owner_id, session_key)
+        if topic == 'orders':
+            return topics.orders_group(owner_id, session_key)
+        if topic.startswith('order:'):
+            try:
+                order_id = int(topic.split(':', 1)[1])
+            except ValueError:
+                return None
+            if await self._owns_order(order_id, owner_id, session_key):
+                return topics.order_group(order_id)
+        return None
+
+    @database_sync_to_async
+    def _owns_order(self, order_id, owner_id, session_key):
+        if owner_id:
+            return Order.objects.filter(pk=order_id, owner_id=owner_id).exists()
+        if session_key:
+            return Order.objects.filter(pk=order_id, session_key=session_key).exists()
+        return False
 
     # receive message from group
     async def site_update(self, event):
@@ -35,3 +125,8 @@ class UpdatesConsumer(AsyncWebsocketConsumer):
             wrapper['model'] = event.get('model')
 
         await self.send(text_data=json.dumps(wrapper))
+
+    # receive a coalesced batch from the outbox; clients still get one message per event
+    async def site_update_batch(self, event):
+        for payload in event.get('events', []):
+            await self.site_update({'data': payload})
@@ -0,0 +1,217 @@
+"""Context assembly shared by the pages that render ``website/home.html``.
+
+``home()`` and ``product_detail()`` both render the full storefront (product
+grid, cart drawer, order history, bundles). ``build_home_context()`` runs
+each of those queries once per request and memoizes the result on the
+request, so a view that needs the context twice doesn't hit the database
+again.
+
+The template caches its expensive sections with ``{% cache %}`` (see
+``website/home.html``): the product grid and bundles per catalog version, the
+cart and order history per visitor and database stamp. The values behind
+those sections are therefore lazy. On a fragment cache hit the grid, cart and
+orders queries never run; only the cheap stamp queries do.
+"""
+from datetime import datetime
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db.models import Q, F, ExpressionWrapper, DecimalField
+from django.db.models.functions import Lower
+from django.middleware.csrf import get_token
+from django.shortcuts import render
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+
+from .models import Product, Order
+from . import pagination, search
+from .cart import get_session_key, cart_queryset, totals_from_items
+from .catalog_cache import get_version
+from .etags import stamp
+from .serializers import bundle_queryset
+from .templatetags.product_extras import CSRF_PLACEHOLDER, is_meaningful
+
+# srcsets loads derived_images, which {% picture %} reads
+BUNDLE_CARD_PRODUCT_FIELDS = ('id', 'name', 'image', 'srcsets')
+
+# Product attributes the templates hide when they hold placeholder values
+DISPLAY_FIELDS = [
+    'brand_model', 'brand', 'color', 'storage_ram', 'network', 'battery', 'camera', 'screen',
+    'processor', 'os', 'accessories', 'condition', 'warranty', 'location', 'optional_details', 'description',
+]
+
+
+def clean_product_fields(product):
+    """Blank out placeholder values (NA, Unknown, ...) on a product instance."""
+    for field in DISPLAY_FIELDS:
+        val = getattr(product, field, None)
+        try:
+            # overwrite attribute on instance so template sees cleaned value
+            setattr(product, field, str(val).strip() if is_meaningful(val) else '')
+        except Exception:
+            # read-only properties such as `brand`
+            pass
+    return product
+
+
+# Distinct order product names per query in match_product_ids()
+MATCH_CHUNK = 100
+
+
+def _chunks(names):
+    names = sorted(names)
+    return [names[i:i + MATCH_CHUNK] for i in range(0, len(names), MATCH_CHUNK)]
+
+
+def match_product_ids(names, products=None):
+    """``{lowercased name: product id}`` for the order product ``names`` that match a product.
+
+    Used when an order is written without a product id (and by the
+    ``Order.product_ref`` backfill): first an exact (case-insensitive) name
+    match, then a partial match on name or brand_model. ``MATCH_CHUNK``
+    distinct names go in each query. ``products`` defaults to every product.
+    """
+    products = products if products is not None else Product.objects.all()
+    names = {name.lower() for name in names if name}
+    # Exact matches; keep the lowest id per name like .first() did
+    matched = {}
+    for chunk in _chunks(names):
+        exact = (products.annotate(lname=Lower('name'))
+                 .filter(lname__in=chunk)
+                 .order_by('id')
+                 .values_list('id', 'lname'))
+        for pid, lname in exact:
+            matched.setdefault(lname, pid)
+
+    # Partial matches for whatever is left, resolved in Python. One OR chain
+    # per chunk: a single chain over every name passes SQLite's expression
+    # depth limit (1000) at about 500 names.
+    for chunk in _chunks(names - set(matched)):
+        q = Q()
+        for name in chunk:
+            q |= Q(name__icontains=name) | Q(brand_model__icontains=name)
+        candidates = list(products.filter(q).order_by('id').values_list('id', 'name', 'brand_model'))
+        for name in chunk:
+            for pid, pname, brand_model in candidates:
+                if name in (pname or '').lower() or name in (brand_model or '').lower():
+                    matched[name] = pid
+                    break
+    return matched
+
+
+def product_detail_context(product):
+    """Context keys for the inline product detail panel."""
+    related_products = Product.objects.filter(category=product.category).exclude(id=product.id)[:4]
+    return {
+        'product': clean_product_fields(product),
+        'related_products': related_products,
+        'show_product_container': True,  # Flag to display the product detail section
+    }
+
+
+def build_home_context(request):
+    """Assemble the storefront context for ``website/home.html``.
+
+    The result is cached on the request; callers get a shallow copy they can
+    extend freely.
+    """
+    cached = getattr(request, '_home_context', None)
+    if cached is not None:
+        return dict(cached)
+
+    search_query = request.GET.get('search', '')
+    filter_query = request.GET.get('filter', '')
+
+    # Browsing pages by cursor (see pagination.py). Search results are ranked
+    # by relevance rather than id, so they keep numbered pages; a search
+    # rarely matches more than a few pages of products.
+    if search_query:
+        page_key = 'page:%s' % request.GET.get("page", "1")
+    else:
+        cursor = pagination.decode_cursor(request.GET.get(pagination.CURSOR_PARAM))
+        page_key = 'cursor:%s:%s' % cursor if cursor else 'first'
+
+    def load_products():
+        product_list = Product.objects.all().order_by('-id')
+
+        if filter_query and filter_query.lower() != "all":
+            product_list = product_list.filter(category__icontains=filter_query)
+
+        if search_query:
+            products = Paginator(search.filter_products(product_list, search_query), pagination.PAGE_SIZE).get_page(request.GET.get("page"))
+        else:
+            products = pagination.paginate(product_list, cursor)
+        # Annotate each product in the page with cleaned values so the template can display them
+        for p in products:
+            clean_product_fields(p)
+        return products
+
+    # Cart totals - scope to current user or session
+    authenticated = bool(request.user and request.user.is_authenticated)
+    session_key = None if authenticated else get_session_key(request, create=True)
+    visitor_key = f'user:{request.user.pk}' if authenticated else f'session:{session_key}'
+
+    cart_rows = cart_queryset(request)
+
+    def load_cart():
+        # Evaluate once; the template iterates the cart several times
+        items = list(cart_rows.annotate(
+            total_price=ExpressionWrapper(F('price') * F('quantity'), output_field=DecimalField())
+        ))
+        return {'items': items, 'totals': totals_from_items(items)}
+
+    cart = SimpleLazyObject(load_cart)
+
+    # Orders - scope to current user or session
+    if authenticated:
+        order_rows = Order.objects.filter(owner=request.user).order_by('-date')
+    else:
+        order_rows = Order.objects.filter(session_key=session_key).order_by('-date') if session_key else Order.objects.none()
+    # Orders carry their product as product_ref, so the history is one query
+    orders = SimpleLazyObject(lambda: list(order_rows))
+    today_date = timezone.now().strftime("%B %d, %Y")
+
+    cart_items = SimpleLazyObject(lambda: cart['items'])
+    context = {
+        'products': SimpleLazyObject(load_products),
+        'date': datetime.now().strftime("%B %d, %Y"),
+        'current_search': search_query,
+        'current_filter': filter_query,
+        'page_key': page_key,
+
+        'cartProducts': cart_items,
+        'cart_items': cart_items,
+        'subtotal': SimpleLazyObject(lambda: "%.2f" % cart['totals']['subtotal']),
+        'taxes': SimpleLazyObject(lambda: "%.2f" % cart['totals']['taxes']),
+        'total': SimpleLazyObject(lambda: "%.2f" % cart['totals']['total']),
+
+        'orders': orders,
+        'total_price': SimpleLazyObject(lambda: sum(order.total for order in orders)),
+        'today_date': today_date,
+
+        # bundles.html shows each bundle's products by id, name and image
+        'bundles': bundle_queryset(BUNDLE_CARD_PRODUCT_FIELDS).order_by('-created_at')[:6],
+
+        # {% cache %} keys for the sections above
+        'fragment_timeout': getattr(settings, 'HOME_FRAGMENT_TIMEOUT', 60),
+        'catalog_version': get_version(),
+        'visitor_key': visitor_key,
+        'cart_stamp': stamp(cart_rows),
+        'orders_stamp': stamp(order_rows),
+    }
+
+    request._home_context = context
+    return dict(context)
+
+
+def render_storefront(request, context):
+    """Render ``website/home.html``, filling in the CSRF token of cached fragments.
+
+    Calling ``get_token()`` also makes sure the CSRF cookie is set, even when
+    every form on the page came out of the fragment cache.
+    """
+    response = render(request, 'website/home.html', context)
+    response.content = response.content.replace(
+        CSRF_PLACEHOLDER.encode(), get_token(request).encode()
+    )
+    return response
@@ -0,0 +1,63 @@
+"""Per-process counters showing how often requests get a new DB connection.
+
+``connection_created`` fires each time Django connects a wrapper, and
+``request_finished`` once per request. A connection taken from a pool is
+not a new one:
+- ``website.backends.sqlite3`` marks it with ``reused_connection``.
+- psycopg's pool counts the physical connections it opened.
+
+``new_per_request`` near 1 means every request pays for a connect. Staff can
+read the numbers at ``/api/db-stats/``.
+"""
+import threading
+from collections import Counter
+
+from django.db import connections
+
+_lock = threading.Lock()
+_connects = Counter()
+_new = Counter()
+_requests = 0
+
+
+def connection_opened(sender, connection, **kwargs):
+    with _lock:
+        _connects[connection.alias] += 1
+        if not getattr(connection, 'reused_connection', False):
+            _new[connection.alias] += 1
+
+
+def request_finished(sender, **kwargs):
+    global _requests
+    with _lock:
+        _requests += 1
+
+
+def _pool_stats(conn):
+    pool = getattr(conn, 'pool', None)
+    if pool is None:
+        return None
+    # psycopg_pool.ConnectionPool, or website.sqlite.ConnectionPool
+    return pool.get_stats() if hasattr(pool, 'get_stats') else pool.stats()
+
+
+def snapshot():
+    with _lock:
+        requests, connects, new = _requests, dict(_connects), dict(_new)
+    databases = {}
+    for alias in connections:
+        conn = connections[alias]
+        pool = _pool_stats(conn)
+        opened = new.get(alias, 0)
+        if pool is not None and 'connections_num' in pool:
+            opened = pool['connections_num']
+        databases[alias] = {
+            'vendor': conn.vendor,
+            'conn_max_age': conn.settings_dict['CONN_MAX_AGE'],
+            'health_checks': conn.settings_dict['CONN_HEALTH_CHECKS'],
+            'connects': connects.get(alias, 0),
+            'new_connections': opened,
+            'new_per_request': round(opened / requests, 3) if requests else None,
+            'pool': pool,
+        }
+    return {'requests': requests, 'databases': databases}
@@ -0,0 +1,99 @@
+"""Send catalog reads to read-only replicas, with read-your-writes.
+
+Storefront traffic is mostly reads of products and bundles. When
+``DATABASE_REPLICAS`` lists aliases, ``CatalogReplicaRouter`` sends those
+reads to one of them, picked at random. Everything else, and every write,
+goes to ``default``. Replica reads then never wait on the primary's writers
+or take its locks.
+
+A client that has just written must see its own write, even if a replica lags
+behind. ``replica_pinning`` middleware therefore keeps a request on
+``default`` when:
+
+- the request is a POST, PUT, PATCH or DELETE;
+- the request has the ``REPLICA_PIN_COOKIE`` cookie, set for
+  ``REPLICA_PIN_SECONDS`` after a request that wrote;
+- the request has already written to a catalog table.
+
+Outside requests (management commands, the job worker, the shell) every
+query goes to ``default``.
+
+With SQLite the replica is the same file opened with ``mode=ro`` (see
+settings). It cannot lag, and it can never hold the write lock.
+"""
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+
+# Routed by label so the router doesn't import models while settings load
+CATALOG_MODELS = frozenset(['website.product', 'website.bundle', 'website.bundle_products'])
+
+# {'pinned': bool, 'wrote': bool} for the current request, None outside one.
+# A dict rather than two variables so that writes made in a sync_to_async
+# thread are seen by the middleware.
+_state = ContextVar('replica_state', default=None)
+
+
+def replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', []))
+
+
+class CatalogReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state['pinned'] or state['wrote'] or model._meta.label_lower not in CATALOG_MODELS:
+            return 'default'
+        aliases = replicas()
+        return random.choice(aliases) if aliases else 'default'
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None and model._meta.label_lower in CATALOG_MODELS:
+            state['wrote'] = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as default
+        databases = {'default', *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in replicas()
+
+
+def _pin_state(request):
+    pinned = request.method not in ('GET', 'HEAD', 'OPTIONS') or settings.REPLICA_PIN_COOKIE in request.COOKIES
+    return {'pinned': pinned, 'wrote': False}
+
+
+def _finish(response, state):
+    if state['wrote']:
+        response.set_cookie(settings.REPLICA_PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS,
+                            httponly=True, samesite='Lax')
+    return response
+
+
+@sync_and_async_middleware
+def replica_pinning(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            state = _pin_state(request)
+            token = _state.set(state)
+            try:
+                return _finish(await get_response(request), state)
+            finally:
+                _state.reset(token)
+    else:
+        def middleware(request):
+            state = _pin_state(request)
+            token = _state.set(state)
+            try:
+                return _finish(get_response(request), state)
+            finally:
+                _state.reset(token)
+    return middleware
@@ -0,0 +1,168 @@
+"""Strong ETags for the polled JSON APIs.
+
+The front end polls the product, bundle and cart endpoints every few seconds.
+Each ETag is built from a cheap database stamp: row count, max ``id`` and max
+``updated_at`` for the rows behind the response. Any create, edit or delete
+changes the stamp, and every worker process computes the same tag. Catalog
+stamps are also cached under the catalog version, so a poll that hits the
+response cache (or gets a 304) doesn't touch the database at all.
+
+``conditional()`` wraps Django's ``condition`` decorator. If ``If-None-Match``
+matches, the client gets a 304 and the view (and its serializer) never runs.
+Async views take the ``a``-prefixed ETag functions.
+"""
+import functools
+import hashlib
+
+from asgiref.sync import iscoroutinefunction
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from django.views.decorators.http import condition
+
+from .cart import acart_queryset, cart_queryset
+from .catalog_cache import acache_get, acache_set, aget_version, cache_get, cache_set, get_version
+from .models import Product, Bundle
+
+
+def _aggregates():
+    return {'rows': Count('id'), 'last_id': Max('id'), 'last_change': Max('updated_at')}
+
+
+def _stamp(agg):
+    last_change = agg['last_change'].isoformat() if agg['last_change'] else ''
+    return (agg['rows'], agg['last_id'] or 0, last_change)
+
+
+def stamp(queryset):
+    """(row count, max id, max updated_at) for ``queryset``, in one query."""
+    return _stamp(queryset.aggregate(**_aggregates()))
+
+
+async def astamp(queryset):
+    return _stamp(await queryset.aaggregate(**_aggregates()))
+
+
+def _stamp_key(name, version):
+    return f'catalog:{version}:stamp:{name}'
+
+
+def catalog_stamp(name, queryset):
+    """``stamp()`` for catalog rows, cached until the next catalog write."""
+    version = get_version()
+    if version is None:
+        return stamp(queryset)
+    value = cache_get(_stamp_key(name, version))
+    if value is None:
+        value = stamp(queryset)
+        cache_set(_stamp_key(name, version), value)
+    return value
+
+
+async def acatalog_stamp(name, queryset):
+    version = await aget_version()
+    if version is None:
+        return await astamp(queryset)
+    value = await acache_get(_stamp_key(name, version))
+    if value is None:
+        value = await astamp(queryset)
+        await acache_set(_stamp_key(name, version), value)
+    return value
+
+
+def make_etag(name, request, *parts):
+    # The URL covers query string and ?format=; Accept picks the DRF renderer
+    raw = '|'.join([name, request.build_absolute_uri(), request.META.get('HTTP_ACCEPT', '')] + [str(p) for p in parts])
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def _safe(request):
+    return request.method in ('GET', 'HEAD')
+
+
+def products_etag(request, *args, **kwargs):
+    if not _safe(request):
+        return None
+    return make_etag('products', request, *catalog_stamp('products', Product.objects.all()))
+
+
+def product_detail_etag(request, pk=None, *args, **kwargs):
+    if not _safe(request):
+        return None
+    return make_etag('product_detail', request, *catalog_stamp(f'product:{pk}', Product.objects.filter(pk=pk)))
+
+
+def bundles_etag(request, *args, **kwargs):
+    if not _safe(request):
+        return None
+    # Bundles embed their products, so product edits change the tag too
+    return make_etag('bundles', request, *catalog_stamp('bundles', Bundle.objects.all()),
+                     *catalog_stamp('products', Product.objects.all()))
+
+
+def _cart_scope(request, user):
+    return user.pk if user is not None and user.is_authenticated else getattr(request.session, 'session_key', None)
+
+
+def cart_etag(request, *args, **kwargs):
+    if not _safe(request):
+        return None
+    scope = _cart_scope(request, getattr(request, 'user', None))
+    return make_etag('cart', request, scope, *stamp(cart_queryset(request)))
+
+
+async def aproducts_etag(request, *args, **kwargs):
+    if not _safe(request):
+        return None
+    return make_etag('products', request, *await acatalog_stamp('products', Product.objects.all()))
+
+
+async def aproduct_detail_etag(request, pk=None, *args, **kwargs):
+    if not _safe(request):
+        return None
+    return make_etag('product_detail', request, *await acatalog_stamp(f'product:{pk}', Product.objects.filter(pk=pk)))
+
+
+async def acart_etag(request, *args, **kwargs):
+    if not _safe(request):
+        return None
+    scope = _cart_scope(request, await request.auser())
+    return make_etag('cart', request, scope, *await astamp(await acart_queryset(request)))
+
+
+def conditional(etag_func, private=False):
+    """Answer ``If-None-Match`` with a 304 before the view runs.
+
+    Responses get ``Cache-Control: no-cache`` so browsers keep the body but
+    revalidate on every poll. ``private`` is for per-visitor data.
+    """
+    def revalidate(request, response):
+        if request.method in ('GET', 'HEAD'):
+            if private:
+                patch_cache_control(response, no_cache=True, private=True)
+            else:
+                patch_cache_control(response, no_cache=True)
+        return response
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            # condition() would call etag_func synchronously, so do its job here
+            @functools.wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                etag = await etag_func(request, *args, **kwargs)
+                etag = quote_etag(etag) if etag is not None else None
+                response = get_conditional_response(request, etag=etag)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                if etag and request.method in ('GET', 'HEAD'):
+                    response.headers.setdefault('ETag', etag)
+                return revalidate(request, response)
+            return async_wrapper
+
+        conditional_view = condition(etag_func=etag_func)(view)
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            return revalidate(request, conditional_view(request, *args, **kwargs))
+        return wrapper
+    return decorator
@@ -0,0 +1,162 @@
+"""Read-only serialization of catalog rows without DRF field machinery.
+
+``ProductSerializer``/``BundleSerializer`` build a model instance per row and
+then walk every field object for every instance. On the polled catalog
+endpoints that costs far more than the query itself. The classes here fetch
+``.values()`` rows and turn them into the same dicts with a precomputed
+converter per column:
+
+- images: media URL prefix, absolute for the request, computed once
+- decimals: quantized and formatted like DRF's ``DecimalField``
+- datetimes: ISO 8601 in the current time zone, like DRF's ``DateTimeField``
+
+Their output must match the DRF serializers exactly; ``tests.FastSerializerTests``
+compares the two. Writes and single-object endpoints keep using DRF.
+"""
+import decimal
+from collections import defaultdict
+
+from django.core.files.storage import FileSystemStorage
+from django.db import models
+from django.utils import timezone
+from django.utils.encoding import filepath_to_uri
+
+from . import images
+from .models import Bundle, Product
+from .serializers import BundleSerializer, ProductSerializer, only_columns
+
+
+def _image_converter(field, request):
+    storage = field.storage
+    if isinstance(storage, FileSystemStorage):
+        prefix = storage.base_url
+        if request is not None:
+            prefix = request.build_absolute_uri(prefix)
+        return lambda name: prefix + filepath_to_uri(name).lstrip('/') if name else None
+    build = request.build_absolute_uri if request is not None else (lambda url: url)
+    return lambda name: build(storage.url(name)) if name else None
+
+
+def _decimal_converter(field):
+    quantum = decimal.Decimal('.1') ** field.decimal_places
+    context = decimal.getcontext().copy()
+    context.prec = field.max_digits
+
+    def convert(value):
+        if value is None:
+            return ''
+        return f'{value.quantize(quantum, context=context):f}'
+    return convert
+
+
+def _datetime(value):
+    if not value:
+        return None
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    text = value.isoformat()
+    return text[:-6] + 'Z' if text.endswith('+00:00') else text
+
+
+class FastRowSerializer:
+    """Serialize ``.values()`` rows of ``serializer_class.Meta.model`` like ``serializer_class``."""
+    serializer_class = None
+    image_fields = ()
+
+    def __init__(self, request=None, fields=None):
+        cls = self.serializer_class
+        self.request = request
+        selected = set(fields) if fields is not None else set(cls.FIELD_PRESETS['detail'])
+        # Same key order as the DRF serializer
+        self.fields = [name for name in cls.Meta.fields if name in selected]
+        self.columns = only_columns(cls, self.fields)
+        self.converters = {}
+        model = cls.Meta.model
+        for name in self.fields:
+            try:
+                field = model._meta.get_field(name)
+            except Exception:
+                continue
+            if isinstance(field, models.FileField):
+                self.converters[name] = _image_converter(field, request)
+            elif isinstance(field, models.DecimalField):
+                self.converters[name] = _decimal_converter(field)
+            elif isinstance(field, models.DateTimeField):
+                self.converters[name] = _datetime
+        self._srcset_url = request.build_absolute_uri if request is not None else None
+
+    def values(self, queryset):
+        return queryset.values(*self.columns)
+
+    def srcsets(self, row):
+        result = {}
+        for field in self.image_fields:
+            name = row.get(field)
+            sets = images.srcsets(name, row['derived_images'], build_url=self._srcset_url) if name else {}
+            if sets:
+                result[field] = sets
+        return result
+
+    def extra(self, rows):
+        """Hook for fields not stored on the row (related objects): ``{pk: {field: value}}``."""
+        return {}
+
+    def serialize(self, rows):
+        rows = list(rows)
+        extra = self.extra(rows)
+        converters = self.converters
+        out = []
+        for row in rows:
+            item = {}
+            related = extra.get(row['id'], {})
+            for name in self.fields:
+                if name == 'srcsets':
+                    item[name] = self.srcsets(row)
+                elif name in related:
+                    item[name] = related[name]
+                elif name in converters:
+                    item[name] = converters[name](row[name])
+                else:
+                    item[name] = row.get(name)
+            out.append(item)
+        return out
+
+
+class FastProductSerializer(FastRowSerializer):
+    serializer_class = ProductSerializer
+    image_fields = images.PRODUCT_IMAGE_FIELDS
+
+
+class FastBundleSerializer(FastRowSerializer):
+    serializer_class = BundleSerializer
+    image_fields = images.BUNDLE_IMAGE_FIELDS
+
+    def __init__(self, request=None, fields=None, nested_fields=None):
+        super().__init__(request, fields)
+        product_fields = (nested_fields or {}).get('product_details')
+        self.products = FastProductSerializer(request, product_fields)
+
+    def extra(self, rows):
+        wanted = {'products', 'product_details'}.intersection(self.fields)
+        if not wanted or not rows:
+            return {}
+        links = (Bundle.products.through.objects
+                 .filter(bundle_id__in=[row['id'] for row in rows])
+                 .order_by('bundle_id', 'product_id')
+                 .values_list('bundle_id', 'product_id'))
+        members = defaultdict(list)
+        for bundle_id, product_id in links:
+            members[bundle_id].append(product_id)
+        details = {}
+        if 'product_details' in wanted:
+            product_ids = {pk for pks in members.values() for pk in pks}
+            products = list(self.products.values(Product.objects.filter(id__in=product_ids)))
+            details = dict(zip((p['id'] for p in products), self.products.serialize(products)))
+        result = {}
+        for row in rows:
+            pks = members.get(row['id'], [])
+            result[row['id']] = {
+                'products': pks,
+                'product_details': [details[pk] for pk in pks if pk in details],
+            }
+        return result
@@ -0,0 +1,263 @@
+"""Resized derivatives of uploaded product and bundle images.
+
+Uploads are stored as-is (often multi-megabyte phone photos or PNG
+screenshots). For every uploaded image we also write smaller copies at each
+width in ``IMAGE_DERIVATIVE_WIDTHS``, in each format of
+``IMAGE_DERIVATIVE_FORMATS``, next to the original::
+
+    products/photo.jpg -> products/photo.w320.avif, products/photo.w320.webp, ...
+
+Templates and serializers only advertise derivatives once they exist, so an
+image that hasn't been processed yet falls back to the original file. They
+don't ask the storage: ``record_derivatives()`` lists the image in its rows'
+``derived_images`` column once the files are written, and ``srcsets()`` reads
+that. A stat per image field, or a HEAD on remote storage, has no place on
+the serialization path.
+"""
+import io
+import logging
+import os
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WIDTHS = (320, 640, 960)
+DEFAULT_FORMATS = ('avif', 'webp', 'jpeg')
+
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+EXTENSIONS = {'avif': 'avif', 'webp': 'webp', 'jpeg': 'jpg'}
+SAVE_OPTIONS = {
+    'avif': {'quality': 60, 'speed': 8},
+    'webp': {'quality': 80, 'method': 4},
+    'jpeg': {'quality': 82, 'optimize': True, 'progressive': True},
+}
+
+# Files we can decode. The model default is an SVG under static/, which we skip.
+RASTER_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp', '.tif', '.tiff', '.avif'}
+
+PRODUCT_IMAGE_FIELDS = ('image', 'image_2', 'image_3', 'image_4')
+BUNDLE_IMAGE_FIELDS = ('image', 'image_2', 'image_3', 'image_4')
+
+
+def widths():
+    return tuple(sorted(getattr(settings, 'IMAGE_DERIVATIVE_WIDTHS', DEFAULT_WIDTHS)))
+
+
+def formats():
+    """Configured formats this Pillow build can actually encode."""
+    from PIL import features
+    available = []
+    for fmt in getattr(settings, 'IMAGE_DERIVATIVE_FORMATS', DEFAULT_FORMATS):
+        if fmt == 'jpeg' or features.check(fmt):
+            available.append(fmt)
+    return tuple(available)
+
+
+def is_derivative(name):
+    suffix = os.path.splitext(os.path.splitext(name or '')[0])[1]
+    return suffix.startswith('.w') and suffix[2:].isdigit()
+
+
+def can_process(name):
+    if not name or is_derivative(name):
+        return False
+    return os.path.splitext(name)[1].lower() in RASTER_EXTENSIONS
+
+
+def derivative_name(name, width, fmt):
+    stem = os.path.splitext(name)[0]
+    return f'{stem}.w{width}.{EXTENSIONS[fmt]}'
+
+
+def derivative_names(name):
+    return [derivative_name(name, width, fmt) for width in widths() for fmt in formats()]
+
+
+def _marker(name):
+    # Written last by generate_derivatives(), so its presence means "all done"
+    return derivative_name(name, widths()[-1], 'jpeg')
+
+
+def has_derivatives(name, storage=None):
+    """Probe the storage for ``name``'s derivatives. For the job and commands, not for rendering."""
+    storage = storage or default_storage
+    if not can_process(name):
+        return False
+    try:
+        return storage.exists(_marker(name))
+    except Exception:
+        return False
+
+
+def _encode(image, fmt):
+    from PIL import Image
+    if fmt == 'jpeg' and image.mode not in ('RGB', 'L'):
+        # JPEG has no alpha: flatten onto white instead of letting transparency go black
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        rgba = image.convert('RGBA')
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        image = background
+    elif image.mode not in ('RGB', 'RGBA', 'L'):
+        image = image.convert('RGBA')
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt.upper(), **SAVE_OPTIONS[fmt])
+    return buffer.getvalue()
+
+
+def generate_derivatives(name, storage=None, force=False):
+    """Write every derivative of ``name``. Returns the names written.
+
+    Images are never upscaled: widths above the original are written at the
+    original size, so the srcset stays complete.
+    """
+    from PIL import Image, ImageOps
+    storage = storage or default_storage
+    if not can_process(name):
+        return []
+    if not force and has_derivatives(name, storage):
+        return []
+
+    with storage.open(name, 'rb') as fh:
+        source = Image.open(fh)
+        source.load()
+    # Phone photos are often stored sideways with an EXIF rotation flag
+    source = ImageOps.exif_transpose(source)
+
+    written = []
+    for width in widths():
+        if source.width > width:
+            height = max(1, round(source.height * width / source.width))
+            resized = source.resize((width, height), Image.LANCZOS)
+        else:
+            resized = source
+        for fmt in sorted(formats(), key=lambda f: f == 'jpeg'):
+            target = derivative_name(name, width, fmt)
+            if storage.exists(target):
+                storage.delete(target)
+            written.append(storage.save(target, ContentFile(_encode(resized, fmt))))
+    return written
+
+
+def strip_exif(content, name):
+    """``content`` (a File being saved as ``name``) without EXIF metadata (GPS position, device serials).
+
+    The EXIF rotation is applied to the pixels first so the picture still
+    shows the right way up. Returns ``content`` itself, rewound, when there is
+    nothing to strip, so stripping twice gives the same bytes. Decoding and
+    re-encoding is slow, so this runs in the ``process_image`` job
+    (``jobs.strip_metadata()``), never in the request storing the upload.
+    """
+    from PIL import Image, ImageOps
+    if not can_process(name):
+        return content
+    content.seek(0)
+    try:
+        source = Image.open(content)
+        source.load()
+    except Exception:
+        # Not something Pillow can decode; store it as uploaded
+        content.seek(0)
+        return content
+    if not source.getexif() and 'exif' not in source.info:
+        content.seek(0)
+        return content
+    fmt = source.format
+    cleaned = ImageOps.exif_transpose(source)
+    cleaned.info.pop('exif', None)
+    buffer = io.BytesIO()
+    options = {'quality': 95} if fmt == 'JPEG' else {}
+    cleaned.save(buffer, format=fmt, **options)
+    return ContentFile(buffer.getvalue())
+
+
+def normalize_media_path(value):
+    """Turn '/media/products/x.jpg' or 'https://host/media/products/x.jpg' into 'products/x.jpg'."""
+    if not value:
+        return value
+    media_prefix = (settings.MEDIA_URL.lstrip('/') if getattr(settings, 'MEDIA_URL', '').startswith('/') else settings.MEDIA_URL) or 'media'
+    v = value.strip()
+    # If full URL, extract path
+    if v.startswith('http://') or v.startswith('https://'):
+        v = urlparse(v).path or v
+    v = v.lstrip('/')
+    if media_prefix and v.startswith(media_prefix):
+        v = v[len(media_prefix):]
+    return v.lstrip('/')
+
+
+def normalize_image_paths(apply=False, report=None):
+    """Normalize cartOrder.image and Order.image.
+
+    Returns ``{model name: (rows processed, rows to change)}``.
+    """
+    from .models import cartOrder, Order
+    report = report or (lambda line: None)
+    counts = {}
+    for model in (cartOrder, Order):
+        total = changed = 0
+        for row in model.objects.all():
+            total += 1
+            orig = getattr(row.image, 'name', row.image) or ''
+            new = normalize_media_path(orig)
+            if new == orig:
+                continue
+            changed += 1
+            report(f"{model.__name__} id={row.id}: '{orig}' -> '{new}'")
+            if apply:
+                row.image = new
+                row.save()
+        counts[model.__name__] = (total, changed)
+    return counts
+
+
+def image_names(instance, fields):
+    names = []
+    for field in fields:
+        value = getattr(instance, field, None)
+        name = getattr(value, 'name', None) or ''
+        if can_process(name):
+            names.append(name)
+    return names
+
+
+def record_derivatives(name, using='default'):
+    """Add ``name`` to ``derived_images`` on every Product and Bundle row showing it. Returns the row count.
+
+    Names no longer in one of the row's image fields are dropped at the same
+    time. Changed rows get a new ``updated_at``, so their ETag stamps move;
+    callers outside a save bump the catalog version as well.
+    """
+    from django.db.models import Q
+    from django.utils import timezone
+    from .models import Product, Bundle
+    updated = 0
+    for model, fields in ((Product, PRODUCT_IMAGE_FIELDS), (Bundle, BUNDLE_IMAGE_FIELDS)):
+        showing = Q()
+        for field in fields:
+            showing |= Q(**{field: name})
+        for row in model.objects.using(using).filter(showing).only('derived_images', *fields):
+            current = set(image_names(row, fields))
+            derived = sorted(n for n in set(row.derived_images or ()) | {name} if n in current)
+            if derived != row.derived_images:
+                model.objects.using(using).filter(pk=row.pk).update(derived_images=derived, updated_at=timezone.now())
+                updated += 1
+    return updated
+
+
+def srcsets(name, derived, storage=None, build_url=None):
+    """``{format: srcset}`` for every available format, or {} if not generated yet.
+
+    ``derived`` is the owning row's ``derived_images``.
+    """
+    storage = storage or default_storage
+    if not name or name not in (derived or ()):
+        return {}
+    build_url = build_url or (lambda url: url)
+    return {
+        fmt: ', '.join(f'{build_url(storage.url(derivative_name(name, width, fmt)))} {width}w' for width in widths())
+        for fmt in formats()
+    }
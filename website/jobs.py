@@ -0,0 +1,216 @@
+"""Background jobs kept in the database.
+
+``enqueue()`` inserts a ``Job`` row in the caller's transaction, so a request
+that rolls back leaves no job behind. Workers claim due jobs with a
+conditional UPDATE (safe with several workers, on SQLite as well as
+PostgreSQL). Jobs never run inside a request. Two kinds of worker drain the
+queue:
+
+- ``start_in_process_worker()``: a daemon thread in each web process
+  (``JOBS_IN_PROCESS``, on by default). The deploy is a single web service
+  that owns the SQLite file, so no other process could reach the database.
+- ``manage.py run_jobs``: a separate process pool that uses every core. It
+  needs the same database and MEDIA_ROOT as the web processes, and a shared
+  cache.
+
+A failed job is retried up to ``JOB_MAX_ATTEMPTS`` times with a growing
+delay, then left as ``failed`` with the traceback in ``last_error``.
+"""
+import datetime
+import logging
+import threading
+import traceback
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db.models import F
+from django.utils import timezone
+
+from . import images
+from .catalog_cache import bump_version
+from .models import Job
+from .storage import is_blob, is_referenced, media_storage, rehome
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+
+
+def handler(kind):
+    """Register ``func`` as the handler for jobs of ``kind``. Payload items become kwargs."""
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+def max_attempts():
+    return getattr(settings, 'JOB_MAX_ATTEMPTS', 3)
+
+
+def retry_delay(attempts):
+    return datetime.timedelta(seconds=getattr(settings, 'JOB_RETRY_DELAY', 30) * attempts)
+
+
+def enqueue(kind, using=None, **payload):
+    if kind not in HANDLERS:
+        raise ValueError(f'Unknown job kind {kind!r}')
+    return Job.objects.using(using or 'default').create(kind=kind, payload=payload)
+
+
+def claim(limit, using='default'):
+    """Mark up to ``limit`` due jobs as running and return their ids."""
+    now = timezone.now()
+    due = (Job.objects.using(using)
+           .filter(status='pending', run_after__lte=now)
+           .order_by('run_after', 'id')
+           .values_list('id', flat=True)[:limit])
+    claimed = []
+    for job_id in due:
+        # Another worker may have taken it between the SELECT and here
+        taken = Job.objects.using(using).filter(pk=job_id, status='pending').update(
+            status='running', attempts=F('attempts') + 1, updated_at=now,
+        )
+        if taken:
+            claimed.append(job_id)
+    return claimed
+
+
+def requeue_stale(using='default', timeout=None):
+    """Put 'running' jobs whose worker died back in the queue. Returns how many."""
+    timeout = timeout if timeout is not None else getattr(settings, 'JOB_TIMEOUT', 600)
+    cutoff = timezone.now() - datetime.timedelta(seconds=timeout)
+    return Job.objects.using(using).filter(status='running', updated_at__lt=cutoff).update(
+        status='pending', updated_at=timezone.now(),
+    )
+
+
+def run_job(job_id, using='default'):
+    """Run one claimed job and record the outcome. Returns True on success."""
+    job = Job.objects.using(using).get(pk=job_id)
+    func = HANDLERS.get(job.kind)
+    try:
+        if func is None:
+            raise LookupError(f'No handler for job kind {job.kind!r}')
+        func(**job.payload)
+    except Exception:
+        logger.exception('Job %s failed', job)
+        error = traceback.format_exc()
+        if job.attempts >= max_attempts():
+            Job.objects.using(using).filter(pk=job.pk).update(status='failed', last_error=error, updated_at=timezone.now())
+        else:
+            Job.objects.using(using).filter(pk=job.pk).update(
+                status='pending', last_error=error, updated_at=timezone.now(),
+                run_after=timezone.now() + retry_delay(job.attempts),
+            )
+        return False
+    Job.objects.using(using).filter(pk=job.pk).update(status='done', last_error='', updated_at=timezone.now())
+    return True
+
+
+def run_pending(limit=100, using='default'):
+    """Run due jobs in this process (tests, or ``run_jobs --processes 0``). Returns how many ran."""
+    ran = 0
+    while ran < limit:
+        batch = claim(min(10, limit - ran), using=using)
+        if not batch:
+            break
+        for job_id in batch:
+            run_job(job_id, using=using)
+        ran += len(batch)
+    return ran
+
+
+_worker = None
+_worker_lock = threading.Lock()
+_stop = threading.Event()
+
+
+def start_in_process_worker(poll=None, using='default'):
+    """Drain the queue from a daemon thread of this process. Returns the thread; starts at most one."""
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _stop.clear()
+            poll = poll if poll is not None else getattr(settings, 'JOB_POLL_INTERVAL', 2.0)
+            _worker = threading.Thread(target=_work, args=(poll, using), name='jobs', daemon=True)
+            _worker.start()
+        return _worker
+
+
+def stop_in_process_worker(timeout=None):
+    """Ask the thread to exit after its current batch and wait for it."""
+    _stop.set()
+    if _worker is not None:
+        _worker.join(timeout)
+
+
+def _work(poll, using):
+    from django.db import connections
+    try:
+        requeue_stale(using=using)
+    except Exception:
+        logger.exception('Could not requeue stale jobs')
+    while True:
+        try:
+            ran = run_pending(using=using)
+        except Exception:
+            logger.exception('In-process job worker failed')
+            ran = 0
+        finally:
+            # This thread's connections only; don't hold one open while idle
+            connections.close_all()
+        if _stop.wait(0 if ran else poll):
+            return
+
+
+# ---------------- HANDLERS ---------------- #
+
+def strip_metadata(name):
+    """Replace upload ``name`` by a copy without EXIF metadata. Returns the name to use from now on.
+
+    The cleaned bytes are a new blob: every row showing ``name`` is pointed at
+    it, and the original is deleted once no row refers to it.
+    """
+    storage = media_storage()
+    with storage.open(name, 'rb') as fh:
+        original = File(fh)
+        cleaned = images.strip_exif(original, name)
+        if cleaned is original:
+            return name
+        clean_name = storage.save(name, cleaned)
+    rehome(name, clean_name)
+    if is_blob(name) and not is_referenced(name):
+        storage.delete(name)
+    return clean_name
+
+
+@handler('process_image')
+def process_image(name):
+    """Strip an upload's metadata, write its resized derivatives and advertise them on the rows showing it."""
+    name = strip_metadata(name)
+    images.generate_derivatives(name)
+    if images.record_derivatives(name):
+        # Cached API responses, home fragments and ETags were built without srcsets
+        bump_version()
+
+
+@handler('normalize_image_paths')
+def normalize_image_paths():
+    images.normalize_image_paths(apply=True)
+
+
+def enqueue_image_processing(instance, fields, using=None):
+    """Queue a ``process_image`` job for each uploaded image on ``instance``.
+
+    An image that was already processed (the same blob on another row) is
+    recorded on ``instance`` straight away.
+    """
+    for name in images.image_names(instance, fields):
+        if name in instance.derived_images:
+            continue
+        if images.has_derivatives(name):
+            images.record_derivatives(name, using=using or 'default')
+        elif default_storage.exists(name):
+            enqueue('process_image', using=using, name=name)
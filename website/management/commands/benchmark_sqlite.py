@@ -0,0 +1,108 @@
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from website import sqlite
+
+# What the old SqlitePragmaMiddleware left every connection with: WAL (stored
+# in the file) and SQLite's defaults for everything else
+BASELINE = {'journal_mode': 'WAL'}
+
+SCHEMA = '''
+CREATE TABLE product (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    category TEXT NOT NULL,
+    price NUMERIC NOT NULL,
+    description TEXT NOT NULL
+);
+CREATE INDEX product_category ON product (category, id);
+'''
+CATEGORIES = ('phones', 'laptops', 'tablets', 'audio', 'accessories')
+
+
+class Command(BaseCommand):
+    help = 'Compare SQLite read/write throughput with and without the connection pragma profiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=20000, help='Products to seed (default: 20000)')
+        parser.add_argument('--writes', type=int, default=500, help='Single-row write transactions (default: 500)')
+        parser.add_argument('--reads', type=int, default=5000, help='Read queries per reader thread (default: 5000)')
+        parser.add_argument('--threads', type=int, default=4, help='Concurrent reader threads (default: 4)')
+
+    def handle(self, *args, **options):
+        configs = [('baseline', BASELINE)] + [(name, sqlite.pragmas(name)) for name in sqlite.PROFILES if name != 'none']
+        results = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            for label, pragmas in configs:
+                path = os.path.join(tmp, f'{label}.sqlite3')
+                self.seed(path, options['rows'])
+                writes = self.bench_writes(path, pragmas, options['writes'])
+                reads = self.bench_reads(path, pragmas, options['reads'], options['threads'], options['rows'])
+                results[label] = (writes, reads)
+
+        base_writes, base_reads = results['baseline']
+        self.stdout.write(f"{'profile':<10} {'writes/s':>10} {'':>7} {'reads/s':>10} {'':>7}")
+        for label, (writes, reads) in results.items():
+            self.stdout.write(f'{label:<10} {writes:>10.0f} {writes / base_writes:>6.1f}x {reads:>10.0f} {reads / base_reads:>6.1f}x')
+
+    def connect(self, path, pragmas):
+        conn = sqlite3.connect(path, timeout=20, isolation_level=None, check_same_thread=False)
+        sqlite.apply(conn.cursor(), pragmas)
+        return conn
+
+    def seed(self, path, rows):
+        conn = self.connect(path, BASELINE)
+        conn.executescript(SCHEMA)
+        rng = random.Random(0)
+        conn.execute('BEGIN')
+        conn.executemany(
+            'INSERT INTO product (name, category, price, description) VALUES (?, ?, ?, ?)',
+            ((f'Product {i}', rng.choice(CATEGORIES), rng.randint(100, 99999) / 100, 'x' * rng.randint(200, 800))
+             for i in range(rows)),
+        )
+        conn.execute('COMMIT')
+        conn.close()
+
+    def bench_writes(self, path, pragmas, count):
+        # One transaction per write, like a checkout or an admin save
+        conn = self.connect(path, pragmas)
+        start = time.perf_counter()
+        for i in range(count):
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('UPDATE product SET price = price + 1 WHERE id = ?', (i + 1,))
+            conn.execute('INSERT INTO product (name, category, price, description) VALUES (?, ?, ?, ?)',
+                         (f'New {i}', 'phones', 1, ''))
+            conn.execute('COMMIT')
+        elapsed = time.perf_counter() - start
+        conn.close()
+        return count / elapsed
+
+    def bench_reads(self, path, pragmas, count, threads, rows):
+        # The storefront's read mix: product pages, a category grid page, a name search
+        def reader(seed):
+            conn = self.connect(path, pragmas)
+            rng = random.Random(seed)
+            for i in range(count):
+                kind = i % 3
+                if kind == 0:
+                    conn.execute('SELECT * FROM product WHERE id = ?', (rng.randint(1, rows),)).fetchall()
+                elif kind == 1:
+                    conn.execute('SELECT id, name, price FROM product WHERE category = ? AND id < ? '
+                                 'ORDER BY id DESC LIMIT 7', (rng.choice(CATEGORIES), rng.randint(1, rows))).fetchall()
+                else:
+                    conn.execute("SELECT id FROM product WHERE name LIKE ? ORDER BY id DESC LIMIT 8",
+                                 (f'Product {rng.randint(1, 999)}%',)).fetchall()
+            conn.close()
+
+        workers = [threading.Thread(target=reader, args=(n,)) for n in range(threads)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return count * threads / (time.perf_counter() - start)
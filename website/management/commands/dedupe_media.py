@@ -0,0 +1,116 @@
+import os
+import time
+
+from django.apps import apps
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from website import images, jobs
+from website.catalog_cache import LOCAL_CACHE_WARNING, bump_version, is_shared
+from website.storage import REFERENCES, is_blob, media_storage, reference_counts
+
+# Directories the site uploads into; nothing else under MEDIA_ROOT is touched
+SCANNED_DIRS = ('blobs', 'products', 'bundles', 'order_images')
+
+
+class Command(BaseCommand):
+    help = ('Move uploaded images into the content-addressed blob store (--migrate) and '
+            'delete files no row references (--gc). Dry run unless --apply is given.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--migrate', action='store_true', help='Rewrite legacy image paths to deduplicated blobs')
+        parser.add_argument('--gc', action='store_true', help='Delete unreferenced files and their derivatives')
+        parser.add_argument('--apply', action='store_true', help='Actually write/delete; otherwise only report')
+        parser.add_argument('--grace-minutes', type=int, default=60,
+                            help='Never delete files newer than this; their rows may not be committed yet (default: 60)')
+
+    def handle(self, *args, **options):
+        if not options['migrate'] and not options['gc']:
+            self.report()
+            return
+        if options['migrate']:
+            self.migrate(options['apply'])
+        if options['gc']:
+            self.collect(options['apply'], options['grace_minutes'])
+        if not options['apply']:
+            self.stdout.write(self.style.WARNING('Dry run complete. Use --apply to make changes.'))
+
+    def report(self):
+        counts = reference_counts()
+        blobs = {name: refs for name, refs in counts.items() if is_blob(name)}
+        self.stdout.write(f'{len(counts)} distinct files referenced, {len(blobs)} of them blobs.')
+        for name, refs in sorted(blobs.items(), key=lambda item: -item[1])[:20]:
+            self.stdout.write(f'  {refs:5d}  {name}')
+
+    def migrate(self, apply):
+        storage = media_storage()
+        moved = {}      # legacy name -> blob name
+        saved_bytes = 0
+        for model_name, fields in REFERENCES:
+            model = apps.get_model('website', model_name)
+            for row in model.objects.all():
+                updates = {}
+                for field in fields:
+                    value = getattr(row, field)
+                    name = images.normalize_media_path(getattr(value, 'name', value) or '')
+                    if not name or is_blob(name) or not images.can_process(name) or not storage.exists(name):
+                        continue
+                    if name not in moved:
+                        with storage.open(name, 'rb') as fh:
+                            blob = storage.name_for(name, File(fh))
+                            if blob in moved.values() or storage.exists(blob):
+                                saved_bytes += storage.size(name)
+                            elif apply:
+                                storage.save(name, File(fh))
+                        moved[name] = blob
+                    updates[field] = moved[name]
+                if updates:
+                    self.stdout.write(f'{model_name} id={row.pk}: ' + ', '.join(f'{f} -> {v}' for f, v in updates.items()))
+                    if apply:
+                        if hasattr(row, 'updated_at'):
+                            updates['updated_at'] = timezone.now()
+                        model.objects.filter(pk=row.pk).update(**updates)
+
+        blobs = set(moved.values())
+        self.stdout.write(f'{len(moved)} legacy files map to {len(blobs)} blobs; '
+                          f'{saved_bytes / 1024:.0f} KB of duplicates folded together.')
+        if apply and moved:
+            bump_version()
+            if not is_shared():
+                self.stdout.write(self.style.WARNING(LOCAL_CACHE_WARNING))
+            for blob in blobs:
+                if images.has_derivatives(blob):
+                    images.record_derivatives(blob)
+                else:
+                    jobs.enqueue('process_image', name=blob)
+            self.stdout.write('Queued derivative jobs for the new blobs; the web process (or manage.py run_jobs) runs them. '
+                              'Run --gc afterwards to delete the old copies.')
+
+    def collect(self, apply, grace_minutes):
+        storage = media_storage()
+        referenced = set(reference_counts())
+        stems = {os.path.splitext(name)[0] for name in referenced}
+        cutoff = time.time() - grace_minutes * 60
+
+        orphans = []
+        for top in SCANNED_DIRS:
+            root = storage.path(top)
+            for dirpath, _dirnames, filenames in os.walk(root):
+                for filename in filenames:
+                    full = os.path.join(dirpath, filename)
+                    name = os.path.relpath(full, storage.location).replace(os.sep, '/')
+                    if name in referenced:
+                        continue
+                    if images.is_derivative(name) and os.path.splitext(os.path.splitext(name)[0])[0] in stems:
+                        continue
+                    if os.path.getmtime(full) > cutoff:
+                        continue
+                    orphans.append((name, os.path.getsize(full)))
+
+        for name, size in orphans:
+            self.stdout.write(f'orphan: {name} ({size / 1024:.0f} KB)')
+            if apply:
+                storage.delete(name)
+        total = sum(size for _name, size in orphans)
+        verb = 'Deleted' if apply else 'Would delete'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {len(orphans)} unreferenced files ({total / 1024 / 1024:.1f} MB).'))
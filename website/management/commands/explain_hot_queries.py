@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import connections
+from website.models import cartOrder, Order
+
+
+class Command(BaseCommand):
+    help = 'Print the query plans (EXPLAIN QUERY PLAN on SQLite) for the hot cart and order lookups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database alias to explain against (default: default)')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        # Placeholder values: the plan only depends on the shape of the query
+        session_key, owner_id, product_id = 'x' * 32, 1, 1
+
+        queries = [
+            ('cart row by session + product',
+             cartOrder.objects.using(using).filter(session_key=session_key, product_id=product_id)),
+            ('cart row by owner + product',
+             cartOrder.objects.using(using).filter(owner_id=owner_id, product_id=product_id)),
+            ('cart by session',
+             cartOrder.objects.using(using).filter(session_key=session_key)),
+            ('cart by owner',
+             cartOrder.objects.using(using).filter(owner_id=owner_id)),
+            ('orders by session, newest first',
+             Order.objects.using(using).filter(session_key=session_key).order_by('-date')),
+            ('orders by owner, newest first',
+             Order.objects.using(using).filter(owner_id=owner_id).order_by('-date')),
+        ]
+
+        vendor = connections[using].vendor
+        unindexed = 0
+        for label, qs in queries:
+            plan = qs.explain()
+            self.stdout.write(self.style.MIGRATE_HEADING(label))
+            self.stdout.write(plan)
+            self.stdout.write('')
+            # SQLite reports a full table scan as 'SCAN <table>' and an
+            # ORDER BY that no index covers as 'USE TEMP B-TREE'
+            if vendor == 'sqlite' and any(
+                ('SCAN ' in line and 'USING' not in line) or 'TEMP B-TREE' in line
+                for line in plan.splitlines()
+            ):
+                unindexed += 1
+
+        if unindexed:
+            self.stdout.write(self.style.WARNING(f'{unindexed} queries scan or sort without an index. Run migrate?'))
+        else:
+            self.stdout.write(self.style.SUCCESS('All hot queries use an index.'))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from website import images, jobs
+from website.catalog_cache import LOCAL_CACHE_WARNING, bump_version, is_shared
+from website.models import Product, Bundle
+
+
+class Command(BaseCommand):
+    help = 'Generate resized AVIF/WebP/JPEG derivatives for existing product and bundle images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate derivatives that already exist')
+
+    def handle(self, *args, **options):
+        names = set()
+        for product in Product.objects.only(*images.PRODUCT_IMAGE_FIELDS):
+            names.update(images.image_names(product, images.PRODUCT_IMAGE_FIELDS))
+        for bundle in Bundle.objects.only(*images.BUNDLE_IMAGE_FIELDS):
+            names.update(images.image_names(bundle, images.BUNDLE_IMAGE_FIELDS))
+
+        done = skipped = failed = recorded = 0
+        for name in sorted(names):
+            try:
+                name = jobs.strip_metadata(name)
+                written = images.generate_derivatives(name, force=options['force'])
+                recorded += images.record_derivatives(name)
+            except FileNotFoundError:
+                self.stdout.write(self.style.WARNING(f'missing: {name}'))
+                failed += 1
+                continue
+            except Exception as exc:
+                self.stdout.write(self.style.ERROR(f'failed: {name} ({exc})'))
+                failed += 1
+                continue
+            if written:
+                done += 1
+            else:
+                skipped += 1
+        if recorded:
+            bump_version()
+            if not is_shared():
+                self.stdout.write(self.style.WARNING(LOCAL_CACHE_WARNING))
+        self.stdout.write(self.style.SUCCESS(f'{done} images processed, {skipped} already up to date, {failed} failed.'))
@@ -0,0 +1,76 @@
+import asyncio
+import statistics
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from website.models import Product
+
+# The endpoints the storefront polls
+PATHS = ['/api/products/', '/api/product/{product}/', '/live-search-products/?search=phone',
+         '/api/orders/', '/api/cart/']
+
+
+class Command(BaseCommand):
+    help = ('Load test the polled JSON endpoints of a running server. Start it with ASYNC_API_VIEWS=0 and '
+            'then =1 to compare the DRF and async views.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Server base URL (default: %(default)s)')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Path to request, repeatable (default: the polled API endpoints)')
+        parser.add_argument('--requests', type=int, default=2000, help='Total requests (default: 2000)')
+        parser.add_argument('--concurrency', type=int, default=50, help='Concurrent clients (default: 50)')
+
+    def handle(self, *args, **options):
+        base = urlsplit(options['url'])
+        if base.scheme != 'http' or not base.hostname:
+            raise CommandError('--url must be an http:// URL')
+        product = Product.objects.order_by('-id').values_list('id', flat=True).first() or 1
+        paths = [path.format(product=product) for path in options['paths'] or PATHS]
+        latencies, statuses, elapsed = asyncio.run(
+            self.run(base.hostname, base.port or 80, paths, options['requests'], options['concurrency']))
+
+        ok = sorted(latencies)
+        self.stdout.write(f"{len(ok)} responses in {elapsed:.2f}s: {len(ok) / elapsed:.0f} req/s "
+                          f"with {options['concurrency']} clients")
+        if len(ok) > 1:
+            cuts = statistics.quantiles(ok, n=100)
+            self.stdout.write('latency ms: p50 {:.1f}  p95 {:.1f}  p99 {:.1f}  max {:.1f}'.format(
+                cuts[49] * 1000, cuts[94] * 1000, cuts[98] * 1000, ok[-1] * 1000))
+        self.stdout.write('status: ' + ', '.join(f'{status}: {n}' for status, n in sorted(statuses.items())))
+
+    async def run(self, host, port, paths, total, concurrency):
+        latencies = []
+        statuses = Counter()
+        remaining = iter(range(total))
+
+        async def client():
+            for n in remaining:
+                start = time.perf_counter()
+                try:
+                    status = await self.fetch(host, port, paths[n % len(paths)])
+                except (OSError, asyncio.IncompleteReadError, ValueError) as exc:
+                    statuses[type(exc).__name__] += 1
+                    continue
+                statuses[status] += 1
+                if status < 500:
+                    latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        return latencies, statuses, time.perf_counter() - start
+
+    async def fetch(self, host, port, path):
+        # One connection per request: what a poll from a fresh tab costs the server
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\nAccept: application/json\r\n'
+                         f'Connection: close\r\n\r\n'.encode('ascii'))
+            await writer.drain()
+            status_line = await reader.readline()
+            await reader.read()
+            return int(status_line.split()[1])
+        finally:
+            writer.close()
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from website import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text product search index from the product table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database alias to rebuild (default: default)')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if not search.index_available(using):
+            self.stdout.write(self.style.WARNING('Search index table not found. Run migrate first.'))
+            return
+        count = search.rebuild_index(using)
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} products.'))
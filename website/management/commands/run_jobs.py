@@ -0,0 +1,91 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from django.core.management.base import BaseCommand, CommandError
+
+# Spawned workers unpickle _run by importing this module before Django is set
+# up, so nothing here may import models at module level.
+
+
+def _init_worker():
+    import django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'liontechweb.settings')
+    django.setup()
+
+
+def _run(job_id, using):
+    from django.db import connections
+    from website import jobs
+    try:
+        return jobs.run_job(job_id, using=using)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (image processing, path fixups) in a process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                            help='Worker processes (default: one per CPU; 0 runs jobs in this process)')
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty instead of polling')
+        parser.add_argument('--poll', type=float, default=2.0, help='Seconds between polls when the queue is empty')
+        parser.add_argument('--database', default='default', help='Database alias holding the job table')
+
+    def handle(self, *args, **options):
+        from website import jobs
+        from website.catalog_cache import is_shared
+        if not is_shared():
+            # Jobs bump the catalog version; the web processes would never see it
+            raise CommandError('run_jobs needs a cache shared with the web processes (set REDIS_URL). '
+                               'With a local-memory cache, leave JOBS_IN_PROCESS on instead.')
+        using = options['database']
+        processes = max(0, options['processes'])
+        requeued = jobs.requeue_stale(using=using)
+        if requeued:
+            self.stdout.write(self.style.WARNING(f'Requeued {requeued} jobs left running by a dead worker.'))
+
+        if processes == 0:
+            self._run_inline(using, options)
+            return
+
+        ok = failed = 0
+        in_flight = set()
+        # 'spawn' so children never inherit the parent's open database connection
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=processes, mp_context=context, initializer=_init_worker) as pool:
+            try:
+                while True:
+                    # Keep every worker busy, plus one queued job each
+                    room = processes * 2 - len(in_flight)
+                    if room > 0:
+                        for job_id in jobs.claim(room, using=using):
+                            in_flight.add(pool.submit(_run, job_id, using))
+                    if not in_flight:
+                        if options['once']:
+                            break
+                        time.sleep(options['poll'])
+                        continue
+                    done, in_flight = wait(in_flight, timeout=options['poll'], return_when=FIRST_COMPLETED)
+                    for future in done:
+                        if future.exception() is None and future.result():
+                            ok += 1
+                        else:
+                            failed += 1
+            except KeyboardInterrupt:
+                self.stdout.write('Stopping; waiting for running jobs to finish.')
+        self.stdout.write(self.style.SUCCESS(f'{ok} jobs done, {failed} failed.'))
+
+    def _run_inline(self, using, options):
+        from website import jobs
+        total = 0
+        while True:
+            ran = jobs.run_pending(using=using)
+            total += ran
+            if not ran:
+                if options['once']:
+                    break
+                time.sleep(options['poll'])
+        self.stdout.write(self.style.SUCCESS(f'{total} jobs run.'))
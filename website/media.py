@@ -0,0 +1,256 @@
+"""Serving uploaded media (``MEDIA_URL``) without copying files through Python.
+
+Django's ``static.serve`` reads every file into the worker and knows nothing
+about ranges or long-lived caching. This module has two front ends that share
+the same request planning (``plan()``):
+
+- ``MediaFilesApp`` wraps the ASGI application (production runs uvicorn). It
+  answers media requests before Django's middleware and views. The
+  filesystem calls (``stat``, ``open``, reading pages of the ``mmap``) may
+  block on disk, so they run in the thread pool, never on the event loop.
+  It uses the ``http.response.zerocopysend`` extension when the server
+  offers it, and otherwise sends slices of an ``mmap`` of the file.
+- ``serve_media`` is a plain Django view for WSGI and ``runserver``. It returns
+  a ``FileResponse`` positioned at the requested range, so WSGI servers with
+  ``wsgi.file_wrapper`` can ``sendfile()`` it.
+
+Both handle ``Range``/``If-Range``, ``If-None-Match`` and
+``If-Modified-Since``. Files under ``blobs/`` are named after their SHA-256
+and never rewritten (see ``storage``), so they, and their derivatives, are
+cached as immutable for a year. Other files get ``MEDIA_CACHE_MAX_AGE``.
+"""
+import mimetypes
+import mmap
+import os
+from dataclasses import dataclass, field
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe
+
+from .storage import is_blob
+
+mimetypes.add_type('image/avif', '.avif')
+mimetypes.add_type('image/webp', '.webp')
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+CHUNK_SIZE = 256 * 1024
+
+
+def in_thread(func):
+    # Filesystem calls can block on disk; keep them off the event loop
+    return sync_to_async(func, thread_sensitive=False)
+
+
+@dataclass
+class Plan:
+    status: int
+    headers: dict = field(default_factory=dict)
+    path: str = ''
+    offset: int = 0
+    length: int = 0
+
+
+def resolve(name):
+    """Absolute path of media file ``name``, or None if it's missing or outside MEDIA_ROOT."""
+    try:
+        path = safe_join(str(settings.MEDIA_ROOT), name)
+    except (SuspiciousFileOperation, ValueError):
+        return None
+    return path if os.path.isfile(path) else None
+
+
+def parse_range(header, size):
+    """(start, end) inclusive for a single ``bytes=`` range; 'invalid' if unsatisfiable; None to ignore."""
+    if not header or not header.startswith('bytes='):
+        return None
+    spec = header[len('bytes='):].strip()
+    if ',' in spec:
+        # Multiple ranges are optional (RFC 9110 14.2); send the whole file
+        return None
+    first, sep, last = spec.partition('-')
+    if not sep:
+        return None
+    try:
+        if first == '':
+            suffix = int(last)
+            if suffix <= 0:
+                return 'invalid'
+            start, end = max(0, size - suffix), size - 1
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return None
+    if start < 0 or start > end or start >= size:
+        return 'invalid'
+    return start, end
+
+
+def _etag(name, stat):
+    if is_blob(name):
+        # The file name already is the content hash
+        return '"%s"' % os.path.basename(name).replace('.', '-')
+    return '"%x-%x"' % (stat.st_mtime_ns, stat.st_size)
+
+
+def _etag_matches(header, etag):
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    candidates = [tag.strip() for tag in header.split(',')]
+    # Weak comparison, as If-None-Match requires
+    return etag in candidates or ('W/' + etag) in candidates
+
+
+def plan(name, method, header):
+    """Work out the response for media file ``name``.
+
+    ``header(lowercase_name)`` returns a request header value or None.
+    """
+    if method not in ('GET', 'HEAD'):
+        return Plan(405, {'Allow': 'GET, HEAD'})
+    path = resolve(name)
+    if path is None:
+        return Plan(404)
+
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = _etag(name, stat)
+    last_modified = http_date(stat.st_mtime)
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    headers = {
+        'ETag': etag,
+        'Last-Modified': last_modified,
+        'Cache-Control': IMMUTABLE if is_blob(name) else f"public, max-age={getattr(settings, 'MEDIA_CACHE_MAX_AGE', 3600)}",
+        'Accept-Ranges': 'bytes',
+    }
+
+    if_none_match = header('if-none-match')
+    if if_none_match is not None:
+        if _etag_matches(if_none_match, etag):
+            return Plan(304, headers)
+    else:
+        since = parse_http_date_safe(header('if-modified-since') or '')
+        if since is not None and int(stat.st_mtime) <= since:
+            return Plan(304, headers)
+
+    headers['Content-Type'] = content_type
+    byte_range = parse_range(header('range'), size)
+    if_range = header('if-range')
+    if byte_range is not None and if_range and if_range not in (etag, last_modified):
+        # The client's partial copy is stale: send the whole new file
+        byte_range = None
+
+    if byte_range == 'invalid':
+        headers['Content-Range'] = f'bytes */{size}'
+        return Plan(416, headers)
+    if byte_range is None:
+        headers['Content-Length'] = str(size)
+        return Plan(200, headers, path, 0, size)
+    start, end = byte_range
+    headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+    headers['Content-Length'] = str(end - start + 1)
+    return Plan(206, headers, path, start, end - start + 1)
+
+
+# ---------------- ASGI ---------------- #
+
+class MediaFilesApp:
+    """ASGI middleware answering ``MEDIA_URL`` requests before they reach Django."""
+
+    def __init__(self, app, prefix=None):
+        self.app = app
+        self.prefix = prefix or settings.MEDIA_URL
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not self.prefix.startswith('/') or not scope['path'].startswith(self.prefix):
+            return await self.app(scope, receive, send)
+
+        request_headers = {}
+        for key, value in scope.get('headers', []):
+            request_headers[key.decode('latin-1').lower()] = value.decode('latin-1')
+        result = await in_thread(plan)(scope['path'][len(self.prefix):], scope['method'], request_headers.get)
+
+        headers = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in result.headers.items()]
+        await send({'type': 'http.response.start', 'status': result.status, 'headers': headers})
+        if not result.length or scope['method'] == 'HEAD':
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+
+        with await in_thread(open)(result.path, 'rb') as fh:
+            if 'http.response.zerocopysend' in scope.get('extensions', {}):
+                await send({'type': 'http.response.zerocopysend', 'file': fh,
+                            'offset': result.offset, 'count': result.length})
+                return
+            with await in_thread(mmap.mmap)(fh.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                end = result.offset + result.length
+                for pos in range(result.offset, end, CHUNK_SIZE):
+                    # Servers want bytes: one memcpy out of the page cache (faulting pages in), no read() calls
+                    chunk = await in_thread(mapped.__getitem__)(slice(pos, min(pos + CHUNK_SIZE, end)))
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+
+# ---------------- WSGI / runserver ---------------- #
+
+class RangedFile:
+    """A window onto an open file.
+
+    ``FileResponse`` reads through it, and WSGI file wrappers ``sendfile()``
+    from the descriptor's current offset up to Content-Length.
+    """
+
+    def __init__(self, fh, offset, length):
+        self.fh = fh
+        self.name = fh.name
+        self.offset = offset
+        self.length = length
+        self.pos = 0
+        fh.seek(offset)
+
+    def read(self, size=-1):
+        remaining = self.length - self.pos
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        data = self.fh.read(size) if size else b''
+        self.pos += len(data)
+        return data
+
+    def seekable(self):
+        return True
+
+    def seek(self, pos, whence=os.SEEK_SET):
+        if whence == os.SEEK_END:
+            pos = self.length + pos
+        elif whence == os.SEEK_CUR:
+            pos = self.pos + pos
+        self.pos = max(0, min(pos, self.length))
+        self.fh.seek(self.offset + self.pos)
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def fileno(self):
+        return self.fh.fileno()
+
+    def close(self):
+        self.fh.close()
+
+
+def serve_media(request, path):
+    result = plan(path, request.method, lambda key: request.headers.get(key))
+    if result.status == 404:
+        raise Http404('Media file not found')
+    if not result.path or request.method == 'HEAD':
+        response = HttpResponse(status=result.status)
+    else:
+        response = FileResponse(RangedFile(open(result.path, 'rb'), result.offset, result.length), status=result.status)
+    for key, value in result.headers.items():
+        response[key] = value
+    return response
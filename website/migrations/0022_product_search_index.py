@@ -0,0 +1,63 @@
+from django.db import migrations
+
+
+SQLITE_CREATE = """
+CREATE VIRTUAL TABLE IF NOT EXISTS website_product_fts USING fts5(
+    name, brand_model, optional_details, category, color,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+)
+"""
+
+SQLITE_FILL = """
+INSERT INTO website_product_fts (rowid, name, brand_model, optional_details, category, color)
+SELECT id, name, brand_model, optional_details, category, color FROM website_product
+"""
+
+POSTGRES_CREATE = """
+CREATE TABLE IF NOT EXISTS website_product_search (
+    product_id bigint PRIMARY KEY REFERENCES website_product (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+    document tsvector NOT NULL
+);
+CREATE INDEX IF NOT EXISTS website_product_search_document_gin ON website_product_search USING GIN (document);
+"""
+
+POSTGRES_FILL = """
+INSERT INTO website_product_search (product_id, document)
+SELECT id,
+    setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce(brand_model, '')), 'B') ||
+    setweight(to_tsvector('simple', coalesce(optional_details, '')), 'D') ||
+    setweight(to_tsvector('simple', coalesce(category, '')), 'C') ||
+    setweight(to_tsvector('simple', coalesce(color, '')), 'D')
+FROM website_product
+"""
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(SQLITE_CREATE)
+        schema_editor.execute(SQLITE_FILL)
+    elif vendor == 'postgresql':
+        schema_editor.execute(POSTGRES_CREATE)
+        schema_editor.execute(POSTGRES_FILL)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS website_product_fts')
+    elif vendor == 'postgresql':
+        schema_editor.execute('DROP TABLE IF EXISTS website_product_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0021_cartorder_owner_cartorder_session_key_order_owner_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
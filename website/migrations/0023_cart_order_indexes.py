@@ -0,0 +1,49 @@
+# Generated by Django 5.2.5 on 2026-10-18 10:32
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_cart_rows(apps, schema_editor):
+    """Fold duplicate (visitor, product) cart rows into one before adding the unique constraints."""
+    cartOrder = apps.get_model('website', 'cartOrder')
+    db = schema_editor.connection.alias
+    for scope in ('owner', 'session_key'):
+        dupes = (cartOrder.objects.using(db)
+                 .filter(**{f'{scope}__isnull': False})
+                 .values(scope, 'product_id')
+                 .annotate(rows=Count('id'), keep=Min('id'), qty=Sum('quantity'))
+                 .filter(rows__gt=1))
+        for dupe in dupes:
+            rows = cartOrder.objects.using(db).filter(**{scope: dupe[scope], 'product_id': dupe['product_id']})
+            rows.filter(id=dupe['keep']).update(quantity=dupe['qty'])
+            rows.exclude(id=dupe['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0022_product_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_cart_rows, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['owner', '-date'], name='order_owner_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['session_key', '-date'], name='order_session_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='cartorder',
+            constraint=models.UniqueConstraint(fields=('owner', 'product_id'), name='cartorder_owner_product_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='cartorder',
+            constraint=models.UniqueConstraint(fields=('session_key', 'product_id'), name='cartorder_session_product_uniq'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.5 on 2026-10-18 10:45
+
+import website.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0025_job_queue'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bundle',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=website.storage.media_storage, upload_to='bundles/'),
+        ),
+        migrations.AlterField(
+            model_name='bundle',
+            name='image_2',
+            field=models.ImageField(blank=True, null=True, storage=website.storage.media_storage, upload_to='bundles/'),
+        ),
+        migrations.AlterField(
+            model_name='bundle',
+            name='image_3',
+            field=models.ImageField(blank=True, null=True, storage=website.storage.media_storage, upload_to='bundles/'),
+        ),
+        migrations.AlterField(
+            model_name='bundle',
+            name='image_4',
+            field=models.ImageField(blank=True, null=True, storage=website.storage.media_storage, upload_to='bundles/'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=website.storage.media_storage, upload_to='order_images/'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='image',
+            field=models.ImageField(storage=website.storage.media_storage, upload_to='products/'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='image_2',
+            field=models.ImageField(blank=True, default='website/images/default-image.svg', null=True, storage=website.storage.media_storage, upload_to='products/'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='image_3',
+            field=models.ImageField(blank=True, default='website/images/default-image.svg', null=True, storage=website.storage.media_storage, upload_to='products/'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='image_4',
+            field=models.ImageField(blank=True, default='website/images/default-image.svg', null=True, storage=website.storage.media_storage, upload_to='products/'),
+        ),
+    ]
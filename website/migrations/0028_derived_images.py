@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:32
+
+from django.db import migrations, models
+
+
+def record_existing_derivatives(apps, schema_editor):
+    # One storage probe per image, once, instead of on every serialization
+    from website import images
+    for model_name, fields in (('Product', images.PRODUCT_IMAGE_FIELDS), ('Bundle', images.BUNDLE_IMAGE_FIELDS)):
+        model = apps.get_model('website', model_name)
+        for row in model.objects.using(schema_editor.connection.alias).only(*fields):
+            derived = sorted({name for name in images.image_names(row, fields) if images.has_derivatives(name)})
+            if derived:
+                model.objects.using(schema_editor.connection.alias).filter(pk=row.pk).update(derived_images=derived)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0027_order_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bundle',
+            name='derived_images',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='derived_images',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.RunPython(record_existing_derivatives, migrations.RunPython.noop),
+    ]
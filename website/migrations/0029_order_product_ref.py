@@ -0,0 +1,37 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def link_existing_orders(apps, schema_editor):
+    # The same name matching the order history used to run on every page view
+    from website.context import match_product_ids
+    alias = schema_editor.connection.alias
+    Order = apps.get_model('website', 'Order')
+    Product = apps.get_model('website', 'Product')
+    orders = list(Order.objects.using(alias).exclude(product='').values_list('id', 'product'))
+    matched = match_product_ids({name for _pk, name in orders}, Product.objects.using(alias))
+    by_product = {}
+    for pk, name in orders:
+        if name.lower() in matched:
+            by_product.setdefault(matched[name.lower()], []).append(pk)
+    for product_id, pks in by_product.items():
+        for start in range(0, len(pks), 500):
+            Order.objects.using(alias).filter(pk__in=pks[start:start + 500]).update(product_ref_id=product_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0028_derived_images'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='product_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='orders', to='website.product'),
+        ),
+        migrations.RunPython(link_existing_orders, migrations.RunPython.noop),
+    ]
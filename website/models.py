@@ -1,6 +1,8 @@
 from django.db import models
 from django.conf import settings
 
+from .storage import media_storage
+
 
 class Product(models.Model):
     CATEGORY_CHOICES = [
@@ -17,11 +19,13 @@ class Product(models.Model):
     ]
 
     name = models.CharField(max_length=255)
-    image = models.ImageField(upload_to='products/')
+    image = models.ImageField(upload_to='products/', storage=media_storage)
     # Additional image slots to ensure each product has at least 4 pictures
-    image_2 = models.ImageField(upload_to='products/', blank=True, null=True, default='website/images/default-image.svg')
-    image_3 = models.ImageField(upload_to='products/', blank=True, null=True, default='website/images/default-image.svg')
-    image_4 = models.ImageField(upload_to='products/', blank=True, null=True, default='website/images/default-image.svg')
+    image_2 = models.ImageField(upload_to='products/', storage=media_storage, blank=True, null=True, default='website/images/default-image.svg')
+    image_3 = models.ImageField(upload_to='products/', storage=media_storage, blank=True, null=True, default='website/images/default-image.svg')
+    image_4 = models.ImageField(upload_to='products/', storage=media_storage, blank=True, null=True, default='website/images/default-image.svg')
+    # Image names whose resized derivatives exist; set by the process_image job (see website/images.py)
+    derived_images = models.JSONField(default=list, blank=True, editable=False)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     category = models.CharField(max_length=100, choices=CATEGORY_CHOICES)
     available = models.BooleanField(default=True)
@@ -41,6 +45,8 @@ class Product(models.Model):
     warranty = models.CharField(max_length=100, default='No Warranty')
     location = models.CharField(max_length=100, default='Local')
     optional_details = models.TextField(blank=True,default='N/A')
+    # Part of the catalog ETag stamp (see website/etags.py)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f"{self.name} ({self.brand_model})"
@@ -84,10 +90,11 @@ class Product(models.Model):
 class Bundle(models.Model):
     title = models.CharField(max_length=255)
     # Allow bundles without a dedicated image; we'll reference product images instead
-    image = models.ImageField(upload_to='bundles/', blank=True, null=True)
-    image_2 = models.ImageField(upload_to='bundles/', blank=True, null=True)
-    image_3 = models.ImageField(upload_to='bundles/', blank=True, null=True)
-    image_4 = models.ImageField(upload_to='bundles/', blank=True, null=True)
+    image = models.ImageField(upload_to='bundles/', storage=media_storage, blank=True, null=True)
+    image_2 = models.ImageField(upload_to='bundles/', storage=media_storage, blank=True, null=True)
+    image_3 = models.ImageField(upload_to='bundles/', storage=media_storage, blank=True, null=True)
+    image_4 = models.ImageField(upload_to='bundles/', storage=media_storage, blank=True, null=True)
+    derived_images = models.JSONField(default=list, blank=True, editable=False)
     image_desc_1 = models.CharField(max_length=255, blank=True, default='')
     image_desc_2 = models.CharField(max_length=255, blank=True, default='')
     price = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
@@ -96,6 +103,7 @@ class Bundle(models.Model):
     # Allow a bundle to reference existing products (optional)
     products = models.ManyToManyField('Product', blank=True, related_name='bundles')
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f"{self.title} - ${self.price}"
@@ -118,14 +126,18 @@ class Order(models.Model):
     delivery_notes = models.TextField(blank=True, null=True, default="")
 
     product = models.CharField(max_length=100, default="Unknown Product")
+    # The ordered product while it exists; ``product`` keeps the name for the record
+    product_ref = models.ForeignKey('Product', null=True, blank=True, on_delete=models.SET_NULL, related_name='orders')
     quantity = models.PositiveIntegerField(default=1)
     price = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     total = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
 
-    image = models.ImageField(upload_to='order_images/', blank=True, null=True)
+    image = models.ImageField(upload_to='order_images/', storage=media_storage, blank=True, null=True)
 
     order_number = models.CharField(max_length=20, unique=False, blank=True, null=True)
     date = models.DateTimeField(auto_now_add=True)
+    # Stamped on every save (status changes too) so cached order history can be keyed on it
+    updated_at = models.DateTimeField(auto_now=True)
     delivery_cost = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     
     delivery_status = models.CharField(
@@ -137,12 +149,23 @@ class Order(models.Model):
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name='orders')
     session_key = models.CharField(max_length=40, blank=True, null=True)
 
+    class Meta:
+        # Order history is always fetched per visitor, newest first
+        indexes = [
+            models.Index(fields=['owner', '-date'], name='order_owner_date_idx'),
+            models.Index(fields=['session_key', '-date'], name='order_session_date_idx'),
+        ]
+
+    @staticmethod
+    def make_order_number(now=None):
+        now = now or timezone.now()
+        # Format order_number: e.g. "202-508-111-638"
+        return f"{now.strftime('%Y')[0:3]}-{now.strftime('%m')}{now.strftime('%d')[0]}-{now.strftime('%d')}{now.strftime('%H')}-{now.strftime('%H')}{now.strftime('%M')}"
 
     def save(self, *args, **kwargs):
+        # bulk_create() skips save(), so callers creating orders in bulk set order_number themselves
         if not self.order_number:
-            now = timezone.now()
-            # Format order_number: e.g. "202-508-111-638"
-            self.order_number = f"{now.strftime('%Y')[0:3]}-{now.strftime('%m')}{now.strftime('%d')[0]}-{now.strftime('%d')}{now.strftime('%H')}-{now.strftime('%H')}{now.strftime('%M')}"
+            self.order_number = self.make_order_number()
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -201,9 +224,46 @@ class cartOrder(models.Model):
     condition = models.CharField(max_length=50, default="N/A")
     added_at = models.DateTimeField(default=timezone.now)  # Default for both old & new
     quantity = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
     # Owner / session key to scope cart items per visitor
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name='cart_items')
     session_key = models.CharField(max_length=40, blank=True, null=True)
 
+    class Meta:
+        # One row per product per visitor. The unique indexes also serve the
+        # (owner|session_key, product_id) lookups and the per-visitor cart scans.
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'product_id'], name='cartorder_owner_product_uniq'),
+            models.UniqueConstraint(fields=['session_key', 'product_id'], name='cartorder_session_product_uniq'),
+        ]
+
     def __str__(self):
         return f"{self.name} ({self.quantity})"
+
+
+class Job(models.Model):
+    """A unit of background work, drained by the web process or ``manage.py run_jobs`` (see website/jobs.py)."""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    run_after = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # the worker's "what's due" lookup
+            models.Index(fields=['status', 'run_after'], name='job_status_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
@@ -0,0 +1,135 @@
+"""Batched, asynchronous delivery of model change events to the channel layer.
+
+Signal handlers used to call ``group_send`` inline, so every ORM write waited
+on the channel layer (Redis in production) and a bulk edit produced one
+message per row. Instead, signal handlers now ``enqueue()`` an event once the
+surrounding transaction commits. A background thread wakes up, waits a short
+window so bursts can pile up, coalesces events for the same object (the last
+state wins), and sends one ``site_update_batch`` message per group (see
+``topics``).
+
+Sending happens on the server's event loop when a consumer has registered it
+with ``bind_loop()``. The in-memory channel layer is not thread-safe, so this
+keeps it working. Otherwise the dispatcher uses a private loop.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Outbox:
+    def __init__(self, window=None, max_batch=None):
+        self.window = window if window is not None else getattr(settings, 'BROADCAST_WINDOW', 0.2)
+        self.max_batch = max_batch or getattr(settings, 'BROADCAST_MAX_BATCH', 200)
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._loop = None
+        self._private_loop = None
+        self.sent_batches = 0
+        self.sent_events = 0
+
+    def bind_loop(self, loop):
+        """Deliver batches on ``loop`` (the ASGI server's event loop)."""
+        self._loop = loop
+
+    def enqueue(self, model, key, payload, groups):
+        """Queue ``payload`` for ``groups``, replacing any pending event for the same object."""
+        with self._lock:
+            for group in groups:
+                slot = (group, model, key)
+                previous = self._pending.pop(slot, None)
+                if previous is not None and previous.get('action') == 'created' and payload.get('action') == 'updated':
+                    # the client hasn't seen the object yet, so it's still a creation
+                    payload = dict(payload, action='created')
+                self._pending[slot] = payload
+        self._ensure_thread()
+        self._wakeup.set()
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """Send everything queued right now, on the calling thread."""
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+            self._deliver(batch)
+
+    def _ensure_thread(self):
+        # (Re)start after fork too: threads don't survive into gunicorn workers
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._private_loop = None
+            self._thread = threading.Thread(target=self._run, name='website-outbox', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            # let a burst of writes accumulate before sending
+            time.sleep(self.window)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Outbox dispatch failed')
+
+    def _take_batch(self):
+        with self._lock:
+            batch = []
+            while self._pending and len(batch) < self.max_batch:
+                (group, _model, _key), payload = self._pending.popitem(last=False)
+                batch.append((group, payload))
+            return batch
+
+    def _deliver(self, batch):
+        by_group = OrderedDict()
+        for group, payload in batch:
+            by_group.setdefault(group, []).append(payload)
+        loop = self._loop
+        if loop is not None and loop.is_running() and not self._on_loop(loop):
+            future = asyncio.run_coroutine_threadsafe(self._send(by_group), loop)
+            future.result(timeout=10)
+        else:
+            if self._private_loop is None or self._private_loop.is_closed():
+                self._private_loop = asyncio.new_event_loop()
+            self._private_loop.run_until_complete(self._send(by_group))
+        self.sent_batches += len(by_group)
+        self.sent_events += len(batch)
+
+    @staticmethod
+    def _on_loop(loop):
+        try:
+            return asyncio.get_running_loop() is loop
+        except RuntimeError:
+            return False
+
+    async def _send(self, by_group):
+        from channels.layers import get_channel_layer
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            return
+        for group, events in by_group.items():
+            try:
+                await channel_layer.group_send(group, {'type': 'site_update_batch', 'events': events})
+            except Exception:
+                logger.exception('Failed to send %d events to %s', len(events), group)
+
+
+outbox = Outbox()
@@ -0,0 +1,185 @@
+"""Keyset ("cursor") pagination for product listings.
+
+``Paginator`` and DRF's ``PageNumberPagination`` run a ``COUNT(*)`` on every
+page and fetch rows with ``OFFSET``, which reads and throws away every row
+before the page. Deep pages of an infinite scroll get slower and slower.
+
+Here a page is fetched relative to the last id the client saw::
+
+    WHERE id < :cursor ORDER BY id DESC LIMIT page_size + 1
+
+This uses the primary key index whatever the depth. The extra row tells us
+whether there is a next page, so no count is needed. Cursors are opaque
+strings (``encode_cursor()``) carrying the boundary id and a direction, so we
+can change their contents later without breaking links.
+
+A total is only computed on request (``estimated_total()``). It is cached
+until the next catalog write, so it can lag slightly behind the database.
+"""
+import base64
+import binascii
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .etags import acatalog_stamp, catalog_stamp
+
+PAGE_SIZE = 6
+CURSOR_PARAM = 'cursor'
+TOTAL_PARAM = 'total'
+
+
+def encode_cursor(pk, reverse=False):
+    raw = f"{'p' if reverse else 'n'}:{pk}".encode('ascii')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(value):
+    """``(pk, reverse)`` for a cursor from ``encode_cursor()``, or None if it isn't one."""
+    if not value:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)).decode('ascii')
+        direction, pk = raw.split(':', 1)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if direction not in ('n', 'p') or pk < 0:
+        return None
+    return pk, direction == 'p'
+
+
+def _pk(row):
+    # Model instances, or .values() dicts from the fast serializers
+    return row['id'] if isinstance(row, dict) else row.pk
+
+
+class KeysetPage:
+    """One page of rows, newest first. Iterates like a ``Page``."""
+
+    def __init__(self, object_list, has_next, has_previous, estimated_total=None):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.estimated_total = estimated_total
+
+    @property
+    def next_cursor(self):
+        return encode_cursor(_pk(self.object_list[-1])) if self.has_next and self.object_list else None
+
+    @property
+    def previous_cursor(self):
+        return encode_cursor(_pk(self.object_list[0]), reverse=True) if self.has_previous and self.object_list else None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+
+def _page_rows(queryset, cursor, page_size):
+    if cursor is None:
+        return queryset.order_by('-id')[:page_size + 1]
+    pk, reverse = cursor
+    if reverse:
+        # Walk backwards from the first row of the page we came from
+        return queryset.filter(id__gt=pk).order_by('id')[:page_size + 1]
+    return queryset.filter(id__lt=pk).order_by('-id')[:page_size + 1]
+
+
+def _page(rows, cursor, page_size):
+    more = len(rows) > page_size
+    if cursor is None:
+        return KeysetPage(rows[:page_size], more, False)
+    if cursor[1]:
+        return KeysetPage(rows[:page_size][::-1], True, more)
+    return KeysetPage(rows[:page_size], more, True)
+
+
+def paginate(queryset, cursor=None, page_size=PAGE_SIZE):
+    """Return the ``KeysetPage`` of ``queryset`` after ``cursor`` (a decoded cursor or None).
+
+    Any ordering on ``queryset`` is replaced by ``-id``.
+    """
+    return _page(list(_page_rows(queryset, cursor, page_size)), cursor, page_size)
+
+
+async def apaginate(queryset, cursor=None, page_size=PAGE_SIZE):
+    return _page([row async for row in _page_rows(queryset, cursor, page_size)], cursor, page_size)
+
+
+def estimated_total(queryset, name):
+    """Row count of ``queryset``, cached per catalog version under ``name``."""
+    return catalog_stamp(f'total:{name}', queryset)[0]
+
+
+async def aestimated_total(queryset, name):
+    return (await acatalog_stamp(f'total:{name}', queryset))[0]
+
+
+def requested_cursor(request):
+    """The decoded ``?cursor=``, or None for the first page. A cursor that doesn't decode is a 404."""
+    value = request.GET.get(CURSOR_PARAM)
+    cursor = decode_cursor(value)
+    if value and cursor is None:
+        raise NotFound('Invalid cursor')
+    return cursor
+
+
+def wants_total(request):
+    return request.GET.get(TOTAL_PARAM) in ('1', 'true', 'yes')
+
+
+def page_body(request, page, results):
+    """The ``{next, previous, results[, count]}`` response body for ``page``."""
+    def link(cursor):
+        if cursor is None:
+            return None
+        return replace_query_param(request.build_absolute_uri(), CURSOR_PARAM, cursor)
+
+    body = {
+        'next': link(page.next_cursor),
+        'previous': link(page.previous_cursor),
+        'results': results,
+    }
+    if page.estimated_total is not None:
+        body['count'] = page.estimated_total
+    return body
+
+
+class KeysetPagination(BasePagination):
+    """DRF pagination using ``paginate()``.
+
+    ``?cursor=`` selects the page, and ``?total=1`` adds an estimated ``count``.
+    A cursor that doesn't decode gets a 404, as it does with DRF's own
+    ``CursorPagination``.
+    """
+    page_size = PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page = paginate(queryset, requested_cursor(request), self.page_size)
+        if wants_total(request):
+            self.page.estimated_total = estimated_total(queryset, f'api:{queryset.model._meta.label_lower}')
+        return list(self.page)
+
+    def get_paginated_response(self, data):
+        return Response(page_body(self.request, self.page, data))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'count': {'type': 'integer'},
+                'results': schema,
+            },
+        }
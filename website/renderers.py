@@ -0,0 +1,48 @@
+"""JSON rendering for the API with orjson when it is installed.
+
+orjson encodes the catalog payloads several times faster than the standard
+library ``json`` module that DRF's ``JSONRenderer`` uses. Anything orjson
+doesn't handle natively (Decimal, lazy strings, and datetimes, which DRF
+formats a little differently) goes through DRF's own encoder, so the output
+is the same either way.
+"""
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # optional; fall back to DRF's renderer
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type or '', renderer_context or {}):
+            # Browsable/pretty output: keep DRF's formatting
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.encoder.default,
+                               option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same as JSONRenderer: these are valid JSON but break inline <script>
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class JSONResponse(HttpResponse):
+    """JSON for plain Django views (the async API views), rendered like the DRF ones.
+
+    Keeps ``data`` as DRF's ``Response`` does, for ``cache_catalog_response``.
+    """
+
+    def __init__(self, data, status=200, **kwargs):
+        kwargs.setdefault('content_type', FastJSONRenderer.media_type)
+        super().__init__(FastJSONRenderer().render(data), status=status, **kwargs)
+        self.data = data
@@ -0,0 +1,203 @@
+"""Full-text product search.
+
+Products are mirrored into a side index table which the Product save/delete
+signals keep in sync:
+
+- SQLite: an FTS5 virtual table (``rowid`` is the product id)
+- PostgreSQL: a ``tsvector`` column with a GIN index
+
+``filter_products()`` (``afilter_products()`` in async views) narrows a
+Product queryset to the matching rows ordered by relevance. Every query token is treated as a prefix so partially typed
+words still match. If the index table is missing (for example before
+``migrate`` has run) we fall back to the old ``icontains`` scan.
+"""
+import logging
+import re
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+from django.db.models import Q
+
+logger = logging.getLogger(__name__)
+
+# Columns mirrored into the index, in the order used by the FTS5 table.
+SEARCH_FIELDS = ('name', 'brand_model', 'optional_details', 'category', 'color')
+
+SQLITE_TABLE = 'website_product_fts'
+POSTGRES_TABLE = 'website_product_search'
+PRODUCT_TABLE = 'website_product'
+
+# bm25() column weights for SQLite, matching SEARCH_FIELDS order.
+SQLITE_WEIGHTS = '10.0, 5.0, 1.0, 2.0, 1.0'
+# setweight() labels for PostgreSQL, matching SEARCH_FIELDS order.
+POSTGRES_WEIGHTS = ('A', 'B', 'D', 'C', 'D')
+
+# Cap the number of tokens so a pasted paragraph can't build a huge query.
+MAX_TOKENS = 8
+
+_TOKEN_RE = re.compile(r'[^\W_]+', re.UNICODE)
+
+# alias -> bool, so we only probe for the index table once per process
+_available = {}
+
+
+def tokenize(query):
+    """Split a free-text query into lowercase word tokens."""
+    return _TOKEN_RE.findall((query or '').lower())[:MAX_TOKENS]
+
+
+def index_available(using='default'):
+    """Return True when the search index table exists for this database."""
+    if using in _available:
+        return _available[using]
+    conn = connections[using]
+    available = False
+    try:
+        with conn.cursor() as cursor:
+            if conn.vendor == 'sqlite':
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE name = %s", [SQLITE_TABLE])
+                available = cursor.fetchone() is not None
+            elif conn.vendor == 'postgresql':
+                cursor.execute("SELECT to_regclass(%s)", [POSTGRES_TABLE])
+                available = cursor.fetchone()[0] is not None
+    except Exception:
+        logger.exception('Failed to probe for the product search index')
+        return False
+    _available[using] = available
+    return available
+
+
+async def aindex_available(using='default'):
+    if using in _available:
+        return _available[using]
+    return await sync_to_async(index_available)(using)
+
+
+def legacy_filter(queryset, query):
+    """The original five-column icontains scan, kept as a fallback."""
+    return queryset.filter(
+        Q(name__icontains=query) |
+        Q(brand_model__icontains=query) |
+        Q(optional_details__icontains=query) |
+        Q(category__icontains=query) |
+        Q(color__icontains=query)
+    )
+
+
+def filter_products(queryset, query):
+    """Filter a Product queryset by a search query, best matches first.
+
+    The result is annotated with ``search_rank`` (lower is better) and ordered
+    by it, newest product first among equal ranks.
+    """
+    tokens = tokenize(query)
+    using = queryset.db
+    if not tokens or not index_available(using):
+        return legacy_filter(queryset, query)
+
+    # extra() rather than RawSQL: bm25()/ts_rank() need the index row joined
+    # into the same query as the MATCH, and the ORM can't join a table that
+    # has no model. A correlated RawSQL subquery re-runs the MATCH for every
+    # row (minutes instead of ~80 ms on 50k products).
+    vendor = connections[using].vendor
+    if vendor == 'sqlite':
+        match = ' '.join('"%s"*' % t for t in tokens)
+        queryset = queryset.extra(
+            tables=[SQLITE_TABLE],
+            where=[
+                '%s.rowid = %s.id' % (SQLITE_TABLE, PRODUCT_TABLE),
+                '%s MATCH %%s' % SQLITE_TABLE,
+            ],
+            params=[match],
+            select={'search_rank': 'bm25(%s, %s)' % (SQLITE_TABLE, SQLITE_WEIGHTS)},
+        )
+    else:
+        tsquery = ' & '.join("%s:*" % t for t in tokens)
+        queryset = queryset.extra(
+            tables=[POSTGRES_TABLE],
+            where=[
+                '%s.product_id = %s.id' % (POSTGRES_TABLE, PRODUCT_TABLE),
+                "%s.document @@ to_tsquery('simple', %%s)" % POSTGRES_TABLE,
+            ],
+            params=[tsquery],
+            select={'search_rank': "-ts_rank(%s.document, to_tsquery('simple', %%s))" % POSTGRES_TABLE},
+            select_params=[tsquery],
+        )
+    return queryset.order_by('search_rank', '-id')
+
+
+async def afilter_products(queryset, query):
+    """``filter_products()`` for async views: probes for the index off the event loop."""
+    if tokenize(query) and not await aindex_available(queryset.db):
+        return legacy_filter(queryset, query)
+    return filter_products(queryset, query)
+
+
+def _postgres_document_sql():
+    parts = [
+        "setweight(to_tsvector('simple', coalesce(%s, '')), '%s')" % (field, weight)
+        for field, weight in zip(SEARCH_FIELDS, POSTGRES_WEIGHTS)
+    ]
+    return ' || '.join(parts)
+
+
+def index_product(product, using='default'):
+    """Insert or refresh a single product in the search index."""
+    if not index_available(using):
+        return
+    conn = connections[using]
+    values = [str(getattr(product, field, '') or '') for field in SEARCH_FIELDS]
+    with conn.cursor() as cursor:
+        if conn.vendor == 'sqlite':
+            cursor.execute('DELETE FROM %s WHERE rowid = %%s' % SQLITE_TABLE, [product.pk])
+            cursor.execute(
+                'INSERT INTO %s (rowid, %s) VALUES (%%s, %s)' % (
+                    SQLITE_TABLE, ', '.join(SEARCH_FIELDS), ', '.join(['%s'] * len(SEARCH_FIELDS))
+                ),
+                [product.pk] + values,
+            )
+        else:
+            document = ' || '.join(
+                "setweight(to_tsvector('simple', %%s), '%s')" % weight for weight in POSTGRES_WEIGHTS
+            )
+            cursor.execute(
+                'INSERT INTO %s (product_id, document) VALUES (%%s, %s) '
+                'ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document' % (POSTGRES_TABLE, document),
+                [product.pk] + values,
+            )
+
+
+def remove_product(product_id, using='default'):
+    """Drop a product from the search index."""
+    if not index_available(using):
+        return
+    conn = connections[using]
+    with conn.cursor() as cursor:
+        if conn.vendor == 'sqlite':
+            cursor.execute('DELETE FROM %s WHERE rowid = %%s' % SQLITE_TABLE, [product_id])
+        else:
+            cursor.execute('DELETE FROM %s WHERE product_id = %%s' % POSTGRES_TABLE, [product_id])
+
+
+def rebuild_index(using='default'):
+    """Repopulate the whole index from the product table. Returns the row count."""
+    if not index_available(using):
+        return 0
+    conn = connections[using]
+    with conn.cursor() as cursor:
+        if conn.vendor == 'sqlite':
+            cursor.execute('DELETE FROM %s' % SQLITE_TABLE)
+            cursor.execute(
+                'INSERT INTO %s (rowid, %s) SELECT id, %s FROM %s' % (
+                    SQLITE_TABLE, ', '.join(SEARCH_FIELDS), ', '.join(SEARCH_FIELDS), PRODUCT_TABLE
+                )
+            )
+        else:
+            cursor.execute('DELETE FROM %s' % POSTGRES_TABLE)
+            cursor.execute(
+                'INSERT INTO %s (product_id, document) SELECT id, %s FROM %s' % (
+                    POSTGRES_TABLE, _postgres_document_sql(), PRODUCT_TABLE
+                )
+            )
+        cursor.execute('SELECT COUNT(*) FROM %s' % PRODUCT_TABLE)
+        return cursor.fetchone()[0]
@@ -1,17 +1,119 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
+from rest_framework.exceptions import ParseError
 from .models import Product, Order
 from .models import Bundle
+from . import images
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """Serialize only the fields a caller asked for.
+
+    Pass ``fields=`` (an iterable of field names) to keep just those; without
+    it a serializer emits its ``"detail"`` preset, the historical full
+    output. ``FIELD_PRESETS`` names common selections; use
+    ``requested_fields()`` to read them from ``?fields=`` / ``?exclude=``.
+    ``nested_fields={'product_details': {...}}`` does the same for a nested
+    serializer.
+    """
+    FIELD_PRESETS = {}
+    # Serializer field -> model columns it reads, when they differ
+    SOURCE_COLUMNS = {}
+
+    def __init__(self, *args, fields=None, nested_fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        keep = set(fields) if fields is not None else set(self.FIELD_PRESETS.get('detail', self.fields))
+        for name in list(self.fields):
+            if name not in keep:
+                self.fields.pop(name)
+        for name, nested in (nested_fields or {}).items():
+            field = self.fields.get(name)
+            child = getattr(field, 'child', field)
+            if child is not None:
+                for child_name in list(child.fields):
+                    if child_name not in nested:
+                        child.fields.pop(child_name)
+
+
+def requested_fields(request, serializer_class, prefix=''):
+    """Field names selected by ``?{prefix}fields=`` and ``?{prefix}exclude=``, or None for the default.
+
+    Both take comma-separated field names and preset names, e.g.
+    ``?fields=card,brand_model`` or ``?exclude=srcsets``. Unknown names are a 400.
+    ``request`` can be a DRF or a plain Django request.
+    """
+    presets = serializer_class.FIELD_PRESETS
+    known = set(presets['admin'])
+
+    def expand(param):
+        raw = request.GET.get(prefix + param)
+        if raw is None:
+            return None
+        names = set()
+        for name in filter(None, (part.strip() for part in raw.split(','))):
+            if name in presets:
+                names.update(presets[name])
+            elif name in known:
+                names.add(name)
+            else:
+                raise ParseError(f'Unknown field {name!r} in ?{prefix}{param}=')
+        return names
+
+    fields, exclude = expand('fields'), expand('exclude')
+    if fields is None and exclude is None:
+        return None
+    return ((fields if fields is not None else set(presets['detail'])) - (exclude or set())) | {'id'}
+
+
+def only_columns(serializer_class, fields):
+    """Model columns needed to serialize ``fields``, for ``QuerySet.only()``."""
+    model = serializer_class.Meta.model
+    concrete = {f.name for f in model._meta.concrete_fields}
+    columns = {'id'}
+    for name in fields:
+        columns.update(c for c in serializer_class.SOURCE_COLUMNS.get(name, (name,)) if c in concrete)
+    return sorted(columns)
+
+
+def image_srcsets(serializer, instance, fields):
+    """``{field: {format: srcset}}`` for the image fields that have derivatives."""
+    request = serializer.context.get('request')
+    build_url = request.build_absolute_uri if request is not None else None
+    result = {}
+    for field in fields:
+        name = getattr(getattr(instance, field, None), 'name', None)
+        sets = images.srcsets(name, instance.derived_images, build_url=build_url) if name else {}
+        if sets:
+            result[field] = sets
+    return result
+
+
+PRODUCT_DETAIL_FIELDS = [
+    'id', 'name', 'image', 'image_2', 'image_3', 'image_4', 'price', 'category', 'available',
+    'brand_model', 'color', 'storage_ram', 'network', 'battery', 'camera', 'screen', 'processor',
+    'os', 'accessories', 'condition', 'warranty', 'location', 'optional_details', 'srcsets',
+]
+
+
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    FIELD_PRESETS = {
+        # What a listing card shows (see live_search.js buildProductCard)
+        'card': ['id', 'name', 'image', 'image_2', 'image_3', 'image_4', 'price', 'category',
+                 'available', 'condition', 'location'],
+        'detail': PRODUCT_DETAIL_FIELDS,
+        'admin': PRODUCT_DETAIL_FIELDS + ['updated_at'],
+    }
+    SOURCE_COLUMNS = {'srcsets': images.PRODUCT_IMAGE_FIELDS + ('derived_images',)}
+
+    srcsets = serializers.SerializerMethodField()
+
+    def get_srcsets(self, obj):
+        return image_srcsets(self, obj, images.PRODUCT_IMAGE_FIELDS)
+
     class Meta:
         model = Product
         # Explicitly list fields to include the new image slots
-        fields = [
-            'id', 'name', 'image', 'image_2', 'image_3', 'image_4', 'price', 'category', 'available',
-            'brand_model', 'color', 'storage_ram', 'network', 'battery', 'camera', 'screen', 'processor',
-            'os', 'accessories', 'condition', 'warranty', 'location', 'optional_details',
-        ]
+        fields = PRODUCT_DETAIL_FIELDS + ['updated_at']
 
 
 class OrderSerializer(serializers.ModelSerializer):
@@ -42,7 +144,20 @@ class OrderSerializer(serializers.ModelSerializer):
         return f"{obj.first_name} {obj.last_name}"
 
 
-class BundleSerializer(serializers.ModelSerializer):
+BUNDLE_DETAIL_FIELDS = [
+    'id', 'title', 'image', 'image_2', 'image_3', 'image_4', 'image_desc_1', 'image_desc_2', 'price',
+    'description', 'badge', 'created_at', 'products', 'product_details', 'srcsets',
+]
+
+
+class BundleSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    FIELD_PRESETS = {
+        'card': ['id', 'title', 'image', 'price', 'badge', 'products'],
+        'detail': BUNDLE_DETAIL_FIELDS,
+        'admin': BUNDLE_DETAIL_FIELDS + ['updated_at'],
+    }
+    SOURCE_COLUMNS = {'srcsets': images.BUNDLE_IMAGE_FIELDS + ('derived_images',)}
+
     # Allow product ids to be included with a bundle
     products = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all(), many=True, required=False)
     # When returning data, also include product details
@@ -54,6 +169,32 @@ class BundleSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError('A bundle can contain at most 2 products.')
         return value
 
+    srcsets = serializers.SerializerMethodField()
+
+    def get_srcsets(self, obj):
+        return image_srcsets(self, obj, images.BUNDLE_IMAGE_FIELDS)
+
     class Meta:
         model = Bundle
-        fields = ['id', 'title', 'image', 'image_2', 'image_3', 'image_4', 'image_desc_1', 'image_desc_2', 'price', 'description', 'badge', 'created_at', 'products', 'product_details']
+        fields = BUNDLE_DETAIL_FIELDS + ['updated_at']
+
+
+def product_queryset(fields=None, extra=()):
+    """Products loading only the columns needed to serialize ``fields`` (default: the detail preset)."""
+    fields = fields if fields is not None else ProductSerializer.FIELD_PRESETS['detail']
+    return Product.objects.only(*only_columns(ProductSerializer, fields), *extra)
+
+
+def bundle_queryset(product_fields=None):
+    """Bundles with their products prefetched in one query, loading only the columns ``product_fields`` need.
+
+    Without the prefetch ``products`` and ``product_details`` each query the
+    M2M table for every bundle (2N+1 queries for N bundles).
+    """
+    return Bundle.objects.prefetch_related(Prefetch('products', queryset=product_queryset(product_fields)))
+
+
+def nested_product_fields(request):
+    """``nested_fields`` for BundleSerializer from ``?product_fields=`` / ``?product_exclude=``."""
+    fields = requested_fields(request, ProductSerializer, prefix='product_')
+    return {'product_details': fields} if fields is not None else None
@@ -1,14 +1,44 @@
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
-from django.db.models.signals import post_save, post_delete
-from django.dispatch import receiver
-from .models import Product, cartOrder, Order
-import json
-
-channel_layer = get_channel_layer()
-
+from contextvars import ContextVar
 
-def broadcast(action, instance, model_name):
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+from .models import Product, Bundle, cartOrder, Order
+from . import search
+from . import suggest
+from . import images
+from . import jobs
+from .catalog_cache import bump_version_on_commit
+from .outbox import outbox
+from . import topics
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Cart groups emptied by the running clear_cart(), None outside it
+_cleared_carts = ContextVar('cleared_carts', default=None)
+
+
+def publish(model_name, key, payload, groups, using=None):
+    """Hand an event to the outbox once the current transaction commits."""
+    if not groups:
+        return
+    transaction.on_commit(lambda: outbox.enqueue(model_name, key, payload, groups), using=using)
+
+
+def groups_for(model_name, instance):
+    """Only the subscribers that care about this object get the event."""
+    if model_name == 'Product':
+        return [topics.CATALOG_GROUP]
+    if model_name == 'cartOrder':
+        return topics.groups_for_cart_item(instance)
+    if model_name == 'Order':
+        return topics.groups_for_order(instance)
+    return []
+
+
+def broadcast(action, instance, model_name, using=None):
     try:
         payload = {
             'action': action,
@@ -31,37 +61,116 @@ def broadcast(action, instance, model_name):
                     'delivery_status': getattr(instance, 'delivery_status', None),
                 }
 
-        async_to_sync(channel_layer.group_send)('site_updates', {'type': 'site_update', 'data': payload})
+        publish(model_name, instance.pk, payload, groups_for(model_name, instance), using=using)
     except Exception:
         # avoid raising from signals
         pass
 
 
+def broadcast_orders_placed(orders):
+    """Send a single 'placed' event for a batch of orders created together.
+
+    Checkout creates all order lines with bulk_create(), which doesn't fire
+    post_save, so this replaces the per-line 'created' broadcasts.
+    """
+    if not orders:
+        return
+    try:
+        first = orders[0]
+        payload = {
+            'action': 'placed',
+            'model': 'Order',
+            'data': {
+                'order_id': first.id,
+                'id': first.id,
+                'order_ids': [o.id for o in orders],
+                'order_number': first.order_number,
+                'count': len(orders),
+                'quantity': sum(o.quantity for o in orders),
+                'total': str(sum(o.total for o in orders)),
+                'delivery_status': first.delivery_status,
+            },
+        }
+        groups = [topics.orders_group(first.owner_id, first.session_key)]
+        publish('Order', ('placed', first.order_number, first.id), payload, [g for g in groups if g])
+    except Exception:
+        pass
+
+
+def clear_cart(queryset):
+    """Delete cart rows with one 'cleared' event per cart instead of a 'deleted' event per row."""
+    groups = set()
+    token = _cleared_carts.set(groups)
+    try:
+        queryset.delete()
+    finally:
+        _cleared_carts.reset(token)
+    for group in groups:
+        publish('cartOrder', ('cleared', group), {'action': 'cleared', 'model': 'cartOrder', 'data': {}},
+                [group], using=queryset.db)
+
+
 @receiver(post_save, sender=Product)
 def product_saved(sender, instance, created, **kwargs):
-    broadcast('created' if created else 'updated', instance, 'Product')
+    try:
+        search.index_product(instance, using=kwargs.get('using') or 'default')
+    except Exception:
+        logger.exception('Failed to index product %s for search', instance.pk)
+    bump_version_on_commit(using=kwargs.get('using'))
+    transaction.on_commit(lambda: suggest.product_changed(instance), using=kwargs.get('using'))
+    broadcast('created' if created else 'updated', instance, 'Product', using=kwargs.get('using'))
+    # Resizing happens in the job worker; the job row commits with the product
+    jobs.enqueue_image_processing(instance, images.PRODUCT_IMAGE_FIELDS, using=kwargs.get('using'))
 
 
 @receiver(post_delete, sender=Product)
 def product_deleted(sender, instance, **kwargs):
-    broadcast('deleted', instance, 'Product')
+    try:
+        search.remove_product(instance.pk, using=kwargs.get('using') or 'default')
+    except Exception:
+        logger.exception('Failed to remove product %s from search index', instance.pk)
+    bump_version_on_commit(using=kwargs.get('using'))
+    product_id = instance.pk
+    transaction.on_commit(lambda: suggest.product_removed(product_id), using=kwargs.get('using'))
+    broadcast('deleted', instance, 'Product', using=kwargs.get('using'))
+
+
+@receiver(post_save, sender=Bundle)
+@receiver(post_delete, sender=Bundle)
+def bundle_changed(sender, instance, **kwargs):
+    bump_version_on_commit(using=kwargs.get('using'))
+    if kwargs.get('signal') is post_save:
+        jobs.enqueue_image_processing(instance, images.BUNDLE_IMAGE_FIELDS, using=kwargs.get('using'))
+
+
+@receiver(m2m_changed, sender=Bundle.products.through)
+def bundle_products_changed(sender, instance, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        # Membership changes don't save the row, so move its ETag stamp by hand.
+        # ``instance`` is the Product when the change came from product.bundles.
+        type(instance).objects.using(kwargs.get('using') or 'default').filter(pk=instance.pk).update(updated_at=timezone.now())
+        bump_version_on_commit(using=kwargs.get('using'))
 
 
 @receiver(post_save, sender=cartOrder)
 def cartorder_saved(sender, instance, created, **kwargs):
-    broadcast('created' if created else 'updated', instance, 'cartOrder')
+    broadcast('created' if created else 'updated', instance, 'cartOrder', using=kwargs.get('using'))
 
 
 @receiver(post_delete, sender=cartOrder)
 def cartorder_deleted(sender, instance, **kwargs):
-    broadcast('deleted', instance, 'cartOrder')
+    cleared = _cleared_carts.get()
+    if cleared is not None:
+        cleared.update(groups_for('cartOrder', instance))
+        return
+    broadcast('deleted', instance, 'cartOrder', using=kwargs.get('using'))
 
 
 @receiver(post_save, sender=Order)
 def order_saved(sender, instance, created, **kwargs):
-    broadcast('created' if created else 'updated', instance, 'Order')
+    broadcast('created' if created else 'updated', instance, 'Order', using=kwargs.get('using'))
 
 
 @receiver(post_delete, sender=Order)
 def order_deleted(sender, instance, **kwargs):
-    broadcast('deleted', instance, 'Order')
+    broadcast('deleted', instance, 'Order', using=kwargs.get('using'))
@@ -0,0 +1,235 @@
+"""Per-connection SQLite tuning and write serialization.
+
+SQLite keeps most settings per connection, and only ``journal_mode=WAL`` is
+stored in the database file. Django opens a connection per thread, and again
+after ``connection.close()`` or ``CONN_MAX_AGE`` expiry. Each one has to be
+configured, so ``configure_connection()`` runs from the ``connection_created``
+signal (connected in ``WebsiteConfig.ready()``).
+
+The pragmas come from a profile in ``PROFILES``, chosen with the
+``SQLITE_PRAGMA_PROFILE`` setting. ``SQLITE_PRAGMAS`` overrides individual
+values, and a value of None drops that pragma.
+
+- ``fast`` (default): WAL with ``synchronous=NORMAL``. A commit no longer waits
+  for an fsync, only checkpoints do. A power cut can lose the last few
+  transactions but never corrupts the database.
+- ``durable``: same as ``fast`` but fsyncs every commit.
+- ``none``: leave SQLite's defaults alone.
+
+``manage.py benchmark_sqlite`` measures the profiles against each other.
+
+SQLite allows one writer at a time. The ``website.backends.sqlite3`` engine
+starts every transaction with ``BEGIN IMMEDIATE``, after taking this
+process's slot in a ``WriteQueue``:
+
+- Threads wanting to write wait their turn in FIFO order. Without the queue
+  they would poll SQLite's busy handler and the unlucky ones would time out.
+- ``BEGIN IMMEDIATE`` takes the write lock up front. A deferred transaction
+  that reads first and then writes can fail at once with "database is
+  locked" when another connection got there first, and busy_timeout does not
+  help.
+
+Other processes still contend through busy_timeout. Reads and single
+autocommit statements don't queue, so they stay concurrent.
+
+Under ASGI every request runs its sync code on a fresh thread, so Django
+opens a new connection per request and ``CONN_MAX_AGE`` can't help. Opening
+is the expensive part: the first statement sets up the WAL index, and the
+pragmas run. With ``OPTIONS['pool']`` the backend returns closed connections
+to a ``ConnectionPool`` and the next request, on any thread, reuses one
+already configured.
+"""
+import logging
+import re
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.db import OperationalError
+
+logger = logging.getLogger(__name__)
+
+_TUNING = {
+    'busy_timeout': 20000,       # ms to wait for a lock before "database is locked"
+    'cache_size': -20000,        # negative = KiB, so ~20 MB of page cache per connection
+    'mmap_size': 134217728,      # read through a 128 MB memory map instead of read() calls
+    'temp_store': 'MEMORY',      # sorts and temp indexes off disk
+}
+
+PROFILES = {
+    'fast': {'journal_mode': 'WAL', 'synchronous': 'NORMAL', **_TUNING},
+    'durable': {'journal_mode': 'WAL', 'synchronous': 'FULL', **_TUNING},
+    'none': {},
+}
+
+_NAME = re.compile(r'^[a-z_]+$')
+_VALUE = re.compile(r'^(-?\d+|[A-Za-z_]+)$')
+
+
+def pragmas(profile=None):
+    """The ``{name: value}`` pragmas for ``profile`` (default: the configured one) plus overrides."""
+    if profile is None:
+        profile = getattr(settings, 'SQLITE_PRAGMA_PROFILE', 'fast')
+    try:
+        result = dict(PROFILES[profile])
+    except KeyError:
+        raise ValueError(f'Unknown SQLITE_PRAGMA_PROFILE {profile!r}; choose from {", ".join(PROFILES)}')
+    result.update(getattr(settings, 'SQLITE_PRAGMAS', {}))
+    return {name: value for name, value in result.items() if value is not None}
+
+
+def statements(values):
+    """``PRAGMA`` statements for a ``pragmas()`` dict. Pragmas can't take parameters, so validate."""
+    result = []
+    for name, value in values.items():
+        if not _NAME.match(name) or not _VALUE.match(str(value)):
+            raise ValueError(f'Invalid SQLite pragma {name}={value!r}')
+        result.append(f'PRAGMA {name}={value}')
+    return result
+
+
+def apply(cursor, values):
+    for statement in statements(values):
+        cursor.execute(statement)
+
+
+def configure_connection(sender, connection, **kwargs):
+    """``connection_created`` receiver: apply the pragma profile to a new SQLite connection."""
+    if connection.vendor != 'sqlite' or getattr(connection, 'reused_connection', False):
+        return
+    values = pragmas()
+    if not values:
+        return
+    # The raw DB-API cursor: these are connection setup, not application queries
+    cursor = connection.connection.cursor()
+    try:
+        apply(cursor, values)
+    except connection.Database.Error:
+        # e.g. switching to WAL while another process holds a lock; the
+        # connection still works, just untuned. Bad settings still raise.
+        logger.exception('Failed to apply SQLite pragmas to connection %s', connection.alias)
+        return
+    finally:
+        cursor.close()
+    logger.debug('Configured SQLite connection %s: %s', connection.alias, values)
+
+
+# ---------------- single writer ---------------- #
+
+class WriteQueue:
+    """A FIFO lock: one write transaction at a time, in arrival order."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._owner = None
+        self._waiters = deque()
+        self.transactions = 0
+        self.waits = 0
+        self.wait_time = 0.0
+
+    def acquire(self, timeout):
+        """Wait up to ``timeout`` seconds for the slot and return its token."""
+        token = threading.Event()
+        with self._lock:
+            self.transactions += 1
+            if self._owner is None and not self._waiters:
+                self._owner = token
+                return token
+            self._waiters.append(token)
+            self.waits += 1
+        start = time.monotonic()
+        handed_over = token.wait(timeout)
+        with self._lock:
+            self.wait_time += time.monotonic() - start
+            if handed_over or self._owner is token:
+                return token
+            self._waiters.remove(token)
+        # What SQLite itself would have said after busy_timeout
+        raise OperationalError('database is locked')
+
+    def release(self, token):
+        with self._lock:
+            if self._owner is not token:
+                return
+            self._owner = self._waiters.popleft() if self._waiters else None
+            if self._owner is not None:
+                self._owner.set()
+
+    def stats(self):
+        with self._lock:
+            return {'transactions': self.transactions, 'waits': self.waits, 'wait_time': self.wait_time,
+                    'queued': len(self._waiters)}
+
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def write_queue(name):
+    """The process-wide ``WriteQueue`` for database file ``name``."""
+    with _queues_lock:
+        return _queues.setdefault(str(name), WriteQueue())
+
+
+# ---------------- connection pool ---------------- #
+
+class ConnectionPool:
+    """Idle ``sqlite3`` connections to one database, up to ``max_size`` of them."""
+
+    def __init__(self, max_size=8):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._idle = deque()
+        self.created = 0
+        self.reused = 0
+        self.discarded = 0
+
+    def get(self):
+        """An idle connection, or None if the caller should open one."""
+        with self._lock:
+            if self._idle:
+                self.reused += 1
+                return self._idle.pop()
+            self.created += 1
+            return None
+
+    def put(self, conn):
+        """Keep ``conn`` for reuse. Returns False if the caller should close it."""
+        if conn.in_transaction:
+            return False
+        with self._lock:
+            if len(self._idle) < self.max_size:
+                self._idle.append(conn)
+                return True
+            self.discarded += 1
+            return False
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for conn in idle:
+            conn.close()
+
+    def stats(self):
+        with self._lock:
+            return {'created': self.created, 'reused': self.reused, 'discarded': self.discarded,
+                    'idle': len(self._idle), 'max_size': self.max_size}
+
+
+_pools = {}
+
+
+def connection_pool(name, options):
+    """The process-wide ``ConnectionPool`` for database file ``name``; ``options`` is ``True`` or a dict."""
+    with _queues_lock:
+        if str(name) not in _pools:
+            _pools[str(name)] = ConnectionPool(**({} if options is True else options))
+        return _pools[str(name)]
+
+
+def close_connection_pool(name):
+    with _queues_lock:
+        pool = _pools.pop(str(name), None)
+    if pool is not None:
+        pool.close()
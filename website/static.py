@@ -0,0 +1,41 @@
+"""WhiteNoise static file serving that doesn't force async requests onto a thread.
+
+``WhiteNoiseMiddleware`` is sync-only. Under ASGI Django then runs it, and
+everything below it in ``MIDDLEWARE``, through ``sync_to_async``, so an async
+view gets called via ``async_to_sync`` from a worker thread. That undoes the
+point of writing it async. This subclass is both sync and async capable. The
+lookup in its async path is a dict read, except with ``WHITENOISE_AUTOREFRESH``
+(DEBUG), which searches the filesystem in a thread.
+
+It reaches into WhiteNoise internals (``files``, ``find_file``,
+``autorefresh``, ``serve``), so requirements.txt pins the exact whitenoise
+version. ``test_whitenoise_internals_are_still_there`` fails if an upgrade
+changes them.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file, thread_sensitive=False)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
@@ -66,7 +66,7 @@ document.addEventListener("DOMContentLoaded", function () {
     // debounce requests to reduce load
     if (searchDebounceTimer) clearTimeout(searchDebounceTimer);
     searchDebounceTimer = setTimeout(() => {
-      fetch(`/live-search-products/?search=${encodeURIComponent(query)}`)
+      fetch(`/live-search-products/?fields=card&search=${encodeURIComponent(query)}`)
         .then(response => response.json())
         .then(data => {
           productList.innerHTML = '';
@@ -91,6 +91,36 @@ document.addEventListener("DOMContentLoaded", function () {
   if (searchInput) searchInput.addEventListener('input', handleLiveSearchInput);
   if (searchInputMobile) searchInputMobile.addEventListener('input', handleLiveSearchInput);
 
+  // Typeahead: product names from the in-memory /suggest/ index fill a datalist
+  // shared by the search boxes. Only a few hundred bytes per keystroke.
+  const suggestionList = document.createElement('datalist');
+  suggestionList.id = 'liveSearchSuggestions';
+  document.body.appendChild(suggestionList);
+  let suggestController = null;
+  function handleSuggestInput(e) {
+    const query = (e.target.value || '').trim();
+    if (suggestController) suggestController.abort();
+    if (!query) { suggestionList.innerHTML = ''; return; }
+    suggestController = new AbortController();
+    fetch(`/suggest/?q=${encodeURIComponent(query)}`, { signal: suggestController.signal })
+      .then(response => response.json())
+      .then(items => {
+        suggestionList.innerHTML = '';
+        items.forEach(item => {
+          const option = document.createElement('option');
+          option.value = item.name;
+          option.label = `$${item.price}`;
+          suggestionList.appendChild(option);
+        });
+      })
+      .catch(err => { if (err.name !== 'AbortError') console.error('Suggest error', err); });
+  }
+  [searchInput, searchInputMobile].forEach(input => {
+    if (!input) return;
+    input.setAttribute('list', suggestionList.id);
+    input.addEventListener('input', handleSuggestInput);
+  });
+
   // Handle category clicks with AJAX (no page reload). Bind both explicit ajax-category
   // buttons and standard category-link anchors rendered in the sidebar.
   document.querySelectorAll('.ajax-category, .category-link').forEach(link => {
@@ -113,7 +143,7 @@ document.addEventListener("DOMContentLoaded", function () {
       if (typeof showSection === 'function') showSection('promotion_page');
 
       // Build API URL - use get_products endpoint which is paginated
-      const apiUrl = `/api/products/?page=1&search=${encodeURIComponent(search)}&filter=${encodeURIComponent(filter)}`;
+      const apiUrl = `/api/products/?fields=card&search=${encodeURIComponent(search)}&filter=${encodeURIComponent(filter)}`;
 
       fetch(apiUrl)
         .then(res => res.json())
@@ -4,10 +4,32 @@
   const host = window.location.host;
   const socketUrl = `${protocol}://${host}/ws/updates/`;
 
+  // Topics this page listens to: catalog, own cart, own order history.
+  // Add 'order:<id>' to follow a single order's status.
+  const topics = new Set(['catalog', 'cart', 'orders']);
+
   let socket;
+  function sendSubscriptions(action, list) {
+    if (socket && socket.readyState === WebSocket.OPEN && list.length) {
+      socket.send(JSON.stringify({ action: action, topics: list }));
+    }
+  }
+
+  window.realtimeSubscribe = function (list) {
+    list.forEach(t => topics.add(t));
+    sendSubscriptions('subscribe', list);
+  };
+  window.realtimeUnsubscribe = function (list) {
+    list.forEach(t => topics.delete(t));
+    sendSubscriptions('unsubscribe', list);
+  };
+
   function connect() {
     socket = new WebSocket(socketUrl);
-    socket.addEventListener('open', () => console.info('realtime: connected'));
+    socket.addEventListener('open', () => {
+      console.info('realtime: connected');
+      sendSubscriptions('subscribe', Array.from(topics));
+    });
     socket.addEventListener('message', (ev) => {
       try {
         const payload = JSON.parse(ev.data);
@@ -25,7 +47,7 @@
     const p = msg.data;
     const model = msg.model || p.model || null;
     // Example: update cart count badge when cartOrder changed
-    if (p.model === 'cartOrder') {
+    if (model === 'cartOrder') {
       try {
         // fetch cart summary to keep server and client in sync
         if (typeof fetchCartData === 'function') fetchCartData();
@@ -33,7 +55,7 @@
     }
 
     // Example: product change -> optionally refresh product grid via AJAX
-    if (p.model === 'Product') {
+    if (model === 'Product') {
       try {
         // If product list exists, re-fetch products endpoint
         if (document.getElementById('productList')) {
@@ -0,0 +1,120 @@
+"""Content-addressed storage for uploaded product, bundle and order images.
+
+Each upload is stored once, under a name derived from the SHA-256 of its
+bytes::
+
+    blobs/3f/3fa9...c2.png
+
+The request stores the upload as sent: hashing is the only work done on it.
+The ``process_image`` job then strips EXIF metadata by saving the cleaned
+bytes as a new blob, pointing the rows at it with ``rehome()`` and deleting
+the original (see ``jobs.strip_metadata()``). Nothing rewrites a blob.
+
+Uploading the same picture twice (or an order copying a product's image)
+therefore yields the same name and no second copy. Because a blob's bytes can
+never change, its URL can be cached forever.
+
+A blob is referenced by the image columns listed in ``REFERENCES``.
+``reference_counts()`` counts those references straight from the database,
+not from signal-maintained counters, because checkout writes orders with
+``bulk_create()``, which fires no signals. ``manage.py dedupe_media`` uses it
+to move legacy files into the store and to delete unreferenced files.
+"""
+import hashlib
+import os
+from collections import Counter
+
+from django.core.files.storage import FileSystemStorage
+
+BLOB_PREFIX = 'blobs'
+
+# (app model name, image columns) whose values are media-relative file names
+REFERENCES = (
+    ('Product', ('image', 'image_2', 'image_3', 'image_4')),
+    ('Bundle', ('image', 'image_2', 'image_3', 'image_4')),
+    ('Order', ('image',)),
+    ('cartOrder', ('image',)),
+)
+
+
+def blob_name(digest, ext=''):
+    return f'{BLOB_PREFIX}/{digest[:2]}/{digest}{ext.lower()}'
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(BLOB_PREFIX + '/')
+
+
+def file_digest(content):
+    """SHA-256 hex digest of a Django File, read in chunks."""
+    sha = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks():
+        sha.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return sha.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that names files after their SHA-256 and stores each blob once."""
+
+    def name_for(self, name, content):
+        """The blob name ``content``, uploaded as ``name``, is stored under."""
+        return blob_name(file_digest(content), os.path.splitext(name)[1])
+
+    def _save(self, name, content):
+        target = self.name_for(name, content)
+        if self.exists(target):
+            return target
+        saved = super()._save(target, content)
+        if saved != target:
+            # An identical upload won the race and got the canonical name first
+            self.delete(saved)
+        return target
+
+
+def media_storage():
+    # Callable so migrations reference this function rather than freezing an instance
+    return ContentAddressedStorage()
+
+
+def _referencing(name, using):
+    from django.apps import apps
+    for model_name, fields in REFERENCES:
+        model = apps.get_model('website', model_name)
+        for field in fields:
+            yield model, field, model.objects.using(using).filter(**{field: name})
+
+
+def is_referenced(name, using='default'):
+    return any(queryset.exists() for _model, _field, queryset in _referencing(name, using))
+
+
+def rehome(old, new, using='default'):
+    """Point every image column holding ``old`` at ``new``. Returns the number of rows changed."""
+    from django.utils import timezone
+    changed = 0
+    for model, field, queryset in _referencing(old, using):
+        updates = {field: new}
+        if any(f.name == 'updated_at' for f in model._meta.concrete_fields):
+            updates['updated_at'] = timezone.now()
+        changed += queryset.update(**updates)
+    return changed
+
+
+def reference_counts():
+    """``Counter`` of media file name -> number of rows pointing at it."""
+    from django.apps import apps
+    from .images import normalize_media_path
+    counts = Counter()
+    for model_name, fields in REFERENCES:
+        model = apps.get_model('website', model_name)
+        for values in model.objects.values_list(*fields):
+            for value in values:
+                # cartOrder.image is free text and may still hold a URL
+                name = normalize_media_path(value or '')
+                if name:
+                    counts[name] += 1
+    return counts
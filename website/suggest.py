@@ -0,0 +1,187 @@
+"""In-process prefix index for search-as-you-type suggestions.
+
+``/live-search-products/`` runs a full-text query and serializes every
+matching product, which is far too heavy to run on each keystroke. The
+suggest endpoint instead answers from a sorted list of ``(term, product id)``
+pairs held in memory. Terms are the words of each product's name, brand/model
+and category. A query token is a prefix, found with ``bisect``; a
+multi-word query keeps the products matching every token.
+
+Each worker process builds its own index from the database on first use. It
+is kept current in two ways:
+
+- The Product save/delete signals in this process update it incrementally
+  once the transaction commits (``product_changed()`` / ``product_removed()``).
+- Writes made anywhere else (other workers, the job worker's
+  ``record_derivatives()``, management commands) are caught by the
+  database: every ``STAMP_CHECK_INTERVAL`` seconds a lookup compares the
+  product table's ``etags.stamp()`` (row count, max id, max ``updated_at``)
+  with the one the index was built from, and rebuilds if it moved. The
+  catalog cache version would not do, since with a local-memory cache other
+  processes' bumps never arrive.
+"""
+import bisect
+import heapq
+import threading
+import time
+
+from django.core.files.storage import default_storage
+
+from . import images
+from .etags import stamp
+from .search import tokenize
+
+DEFAULT_LIMIT = 8
+MAX_LIMIT = 20
+STAMP_CHECK_INTERVAL = 2.0
+
+INDEXED_FIELDS = ('name', 'brand_model', 'category')
+LOADED_FIELDS = ('id', 'name', 'brand_model', 'category', 'price', 'image', 'derived_images')
+
+# Sorts after any character, so [prefix, prefix + END) spans every key starting with prefix
+END = '\U0010ffff'
+
+
+class SuggestIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._terms = []        # sorted [(term, product id)]
+        self._names = []        # sorted [(normalized name, product id)]
+        self._entries = {}      # product id -> {'id', 'name', 'lname', 'price', 'image', 'terms'}
+        self._thumbnails = {}   # image name -> URL, once its derivatives exist
+        self._built = False
+        self._stamp = None
+        self._checked_at = 0.0
+
+    # ---- maintenance ----
+
+    @staticmethod
+    def _terms_for(values):
+        terms = set()
+        for field in INDEXED_FIELDS:
+            terms.update(tokenize(str(values.get(field) or '')))
+        return terms
+
+    def _entry(self, values):
+        return {
+            'id': values['id'],
+            'name': values['name'] or '',
+            'lname': ' '.join(tokenize(values['name'] or '')),
+            'price': str(values['price']),
+            'image': getattr(values['image'], 'name', values['image']) or '',
+            'derived': values['derived_images'] or (),
+            'terms': self._terms_for(values),
+        }
+
+    def _insert(self, values):
+        entry = self._entry(values)
+        self._entries[entry['id']] = entry
+        bisect.insort(self._names, (entry['lname'], entry['id']))
+        for term in entry['terms']:
+            bisect.insort(self._terms, (term, entry['id']))
+
+    def _delete(self, product_id):
+        entry = self._entries.pop(product_id, None)
+        if entry is None:
+            return
+        for items, key in [(self._names, entry['lname'])] + [(self._terms, term) for term in entry['terms']]:
+            pos = bisect.bisect_left(items, (key, product_id))
+            if pos < len(items) and items[pos] == (key, product_id):
+                del items[pos]
+
+    @staticmethod
+    def _current_stamp():
+        from .models import Product
+        return stamp(Product.objects.all())
+
+    def rebuild(self):
+        from .models import Product
+        # Taken first: a write racing the load below moves it again
+        current = self._current_stamp()
+        rows = list(Product.objects.values(*LOADED_FIELDS))
+        with self._lock:
+            self._entries = {values['id']: self._entry(values) for values in rows}
+            self._names = sorted((e['lname'], pk) for pk, e in self._entries.items())
+            self._terms = sorted((term, pk) for pk, e in self._entries.items() for term in e['terms'])
+            self._built = True
+            self._stamp = current
+            self._checked_at = time.monotonic()
+
+    def update(self, product):
+        """Add or refresh one product."""
+        values = {field: getattr(product, field) for field in LOADED_FIELDS}
+        with self._lock:
+            if not self._built:
+                return
+            self._delete(product.pk)
+            self._insert(values)
+
+    def remove(self, product_id):
+        with self._lock:
+            if not self._built:
+                return
+            self._delete(product_id)
+
+    def _ensure_current(self):
+        if not self._built:
+            self.rebuild()
+            return
+        now = time.monotonic()
+        if now - self._checked_at < STAMP_CHECK_INTERVAL:
+            return
+        self._checked_at = now
+        # Our own writes move the stamp too and cost one rebuild; they are rare
+        if self._current_stamp() != self._stamp:
+            self.rebuild()
+
+    # ---- lookups ----
+
+    @staticmethod
+    def _prefix_range(items, prefix):
+        return items[bisect.bisect_left(items, (prefix,)):bisect.bisect_left(items, (prefix + END,))]
+
+    def _matching(self, token):
+        return {pk for _term, pk in self._prefix_range(self._terms, token)}
+
+    def _thumbnail(self, name, derived):
+        url = self._thumbnails.get(name)
+        if url is None:
+            if not name:
+                return ''
+            if name not in derived:
+                # Not processed yet: fall back to the upload, check again next time
+                return default_storage.url(name)
+            url = self._thumbnails[name] = default_storage.url(images.derivative_name(name, images.widths()[0], 'jpeg'))
+        return url
+
+    def suggest(self, query, limit=DEFAULT_LIMIT):
+        """Up to ``limit`` ``{id, name, thumbnail, price}`` dicts for ``query``.
+
+        Names starting with the query come first, then the newest other matches.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        self._ensure_current()
+        with self._lock:
+            ids = set.intersection(*(self._matching(token) for token in tokens))
+            # Names starting with the query: usually a handful, found by bisect
+            starts = sorted((pk for _name, pk in self._prefix_range(self._names, ' '.join(tokens)) if pk in ids),
+                            reverse=True)[:limit]
+            rest = heapq.nlargest(limit - len(starts), ids.difference(starts)) if len(starts) < limit else []
+            entries = [self._entries[pk] for pk in starts + rest]
+        return [
+            {'id': e['id'], 'name': e['name'], 'thumbnail': self._thumbnail(e['image'], e['derived']), 'price': e['price']}
+            for e in entries
+        ]
+
+
+index = SuggestIndex()
+
+
+def product_changed(product):
+    index.update(product)
+
+
+def product_removed(product_id):
+    index.remove(product_id)
@@ -1,7 +1,13 @@
 from django import template
+from django.utils.html import format_html
+
+from website import images
 
 register = template.Library()
 
+# Stands in for the CSRF token inside {% cache %} blocks; see context.render_storefront()
+CSRF_PLACEHOLDER = '__csrf_token_placeholder__'
+
 @register.filter(name='is_meaningful')
 def is_meaningful(value):
     """Return True if the value is not empty and not a variant of 'NA'.
@@ -36,3 +42,39 @@ def to_int(value, default=0):
             return int(float(str(value)))
         except Exception:
             return default
+
+
+@register.inclusion_tag('website/partials/picture.html')
+def picture(image, alt='', css_class='', sizes='100vw', loading='', product_id=None, style=''):
+    """Render ``<picture>`` for an ImageField, offering AVIF/WebP/JPEG derivatives when they exist.
+
+    Usage: {% picture product.image product.name css_class="img-fluid" sizes="(max-width: 576px) 100vw, 33vw" %}
+    """
+    name = getattr(image, 'name', '') or ''
+    try:
+        src = image.url
+    except Exception:
+        src = ''
+    sets = images.srcsets(name, getattr(getattr(image, 'instance', None), 'derived_images', ())) if name else {}
+    return {
+        'src': src,
+        'sources': [{'type': images.MIME_TYPES[fmt], 'srcset': sets[fmt]} for fmt in sets if fmt != 'jpeg'],
+        'fallback_srcset': sets.get('jpeg', ''),
+        'alt': alt,
+        'css_class': css_class,
+        'sizes': sizes,
+        'loading': loading,
+        'product_id': product_id,
+        'style': style,
+    }
+
+
+@register.simple_tag
+def cached_csrf_token():
+    """``{% csrf_token %}`` for fragments inside ``{% cache %}``.
+
+    A cached fragment is shared between visitors, so it must not contain
+    anyone's token. This writes a placeholder that ``render_storefront()``
+    swaps for the current visitor's token after rendering.
+    """
+    return format_html('<input type="hidden" name="csrfmiddlewaretoken" value="{}">', CSRF_PLACEHOLDER)
@@ -0,0 +1,47 @@
+"""Channel-layer group names for the realtime update topics.
+
+Clients subscribe to topics over the websocket. Each topic maps to one group,
+and signals route every event only to the groups that need it:
+
+- ``catalog``: product changes, shared by everyone
+- ``cart``: the visitor's own cart (per user, or per session when anonymous)
+- ``orders``: the visitor's own order history
+- ``order:<id>``: status changes of one order the visitor owns
+"""
+
+CATALOG_GROUP = 'catalog'
+
+
+def _visitor_suffix(owner_id=None, session_key=None):
+    if owner_id:
+        return f'user.{owner_id}'
+    if session_key:
+        return f'session.{session_key}'
+    return None
+
+
+def cart_group(owner_id=None, session_key=None):
+    suffix = _visitor_suffix(owner_id, session_key)
+    return f'cart.{suffix}' if suffix else None
+
+
+def orders_group(owner_id=None, session_key=None):
+    suffix = _visitor_suffix(owner_id, session_key)
+    return f'orders.{suffix}' if suffix else None
+
+
+def order_group(order_id):
+    return f'order.{order_id}'
+
+
+def groups_for_cart_item(item):
+    group = cart_group(item.owner_id, item.session_key)
+    return [group] if group else []
+
+
+def groups_for_order(order):
+    groups = [order_group(order.pk)]
+    visitor = orders_group(order.owner_id, order.session_key)
+    if visitor:
+        groups.insert(0, visitor)
+    return groups
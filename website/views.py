@@ -1,34 +1,41 @@
 from django.shortcuts import render, redirect
 from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse
-from django.core.paginator import Paginator
-from datetime import datetime
 import json
 from decimal import Decimal
 from random import sample
 
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.views import APIView
 from rest_framework.parsers import MultiPartParser, FormParser
 
 from django.conf import settings
 import logging
 
-from django.db.models import Q, F, ExpressionWrapper, DecimalField
+from django.db import IntegrityError, OperationalError, transaction
+from django.db.models import F
 from django.utils import timezone
 from django.views.decorators.http import require_POST
 
 from .models import Product, Order, Cart, cartOrder
 from .serializers import ProductSerializer, OrderSerializer
-from .serializers import BundleSerializer
+from .serializers import BundleSerializer, requested_fields, nested_product_fields, product_queryset, bundle_queryset
+from .fast_serializers import FastProductSerializer, FastBundleSerializer
 from .models import Bundle
+from . import db_metrics, search, suggest
+from .context import build_home_context, match_product_ids, product_detail_context, render_storefront
+from .cart import cart_queryset, cart_totals, format_totals, cart_payload, with_line_totals
+from .signals import broadcast_orders_placed, clear_cart
+from .catalog_cache import cache_catalog_response
+from .etags import conditional, products_etag, product_detail_etag, bundles_etag, cart_etag
+from .pagination import CURSOR_PARAM, KeysetPagination, decode_cursor, paginate
 
 from .forms import ProductForm
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django import forms
 from django.shortcuts import HttpResponse
 from django.urls import reverse
@@ -178,35 +185,21 @@ def remove_from_cart(request, product_id):
         request.session['cart'] = cart
 
     # Also remove any persistent cartOrder entries for this product (scope to user/session)
+    cart_items = cart_queryset(request)
     try:
-        session_key = request.session.session_key
-        if request.user.is_authenticated:
-            qs = cartOrder.objects.filter(product_id=product_id, owner=request.user)
-        else:
-            qs = cartOrder.objects.filter(product_id=product_id, session_key=session_key)
-        deleted_count, _ = qs.delete()
+        deleted_count, _ = cart_items.filter(product_id=product_id).delete()
     except Exception:
         # If something goes wrong, still return success=False
         return JsonResponse({'success': False, 'message': 'Failed to remove item from database.'})
 
     # Compute updated totals to return to client (helps UI update without extra fetch)
-    if request.user.is_authenticated:
-        cart_items = cartOrder.objects.filter(owner=request.user)
-    else:
-        sk = request.session.session_key
-        cart_items = cartOrder.objects.filter(session_key=sk)
-    subtotal = sum(item.price * item.quantity for item in cart_items) if cart_items else 0
-    taxes = subtotal * Decimal('0.15') if subtotal else Decimal('0')
-    total = subtotal + taxes if subtotal else Decimal('0')
-    total_items = sum(item.quantity for item in cart_items)
+    totals = cart_totals(cart_items)
 
     return JsonResponse({
         'success': True,
         'deleted_count': deleted_count,
-        'subtotal': f"{subtotal:.2f}",
-        'taxes': f"{taxes:.2f}",
-        'total': f"{total:.2f}",
-        'total_items': total_items,
+        **format_totals(totals),
+        'total_items': totals['total_items'],
     })
 
 
@@ -260,139 +253,7 @@ def product_create_view(request):
 
 
 def home(request):
-    search_query = request.GET.get('search', '')
-    filter_query = request.GET.get('filter', '')
-
-    product_list = Product.objects.all().order_by('-id')
-
-    if filter_query and filter_query.lower() != "all":
-        product_list = product_list.filter(category__icontains=filter_query)
-
-    if search_query:
-        product_list = product_list.filter(
-            Q(name__icontains=search_query) |
-            Q(brand_model__icontains=search_query) |
-            Q(optional_details__icontains=search_query) |
-            Q(category__icontains=search_query) |
-            Q(color__icontains=search_query)
-        )
-
-    paginator = Paginator(product_list, 6)
-    page_number = request.GET.get("page")
-    products = paginator.get_page(page_number)
-
-    # Local helper: determine if a product field is meaningful (matches template filter logic)
-    def is_meaningful(value):
-        if value is None:
-            return False
-        try:
-            s = str(value).strip()
-        except Exception:
-            return False
-        if s == '':
-            return False
-        low = s.lower()
-        na_variants = {'na', 'n/a', 'none', 'null', '-', 'n.a.', 'n.a', 'n/a.', 'n a', 'n.a..', 'unknown', 'n/a (not applicable)', 'n/a (na)'}
-        if low in na_variants:
-            return False
-        return True
-
-    # Annotate each product in the page with cleaned values so the template can display them
-    try:
-        for p in products:
-            # list of fields we want to ensure are empty when not meaningful
-            for field in ['brand_model', 'brand', 'color', 'storage_ram', 'network', 'battery', 'camera', 'screen', 'processor', 'os', 'accessories', 'condition', 'warranty', 'location', 'optional_details', 'description']:
-                val = getattr(p, field, None)
-                if is_meaningful(val):
-                    # normalize whitespace
-                    cleaned = str(val).strip()
-                    # overwrite attribute on instance so template sees cleaned value
-                    try:
-                        setattr(p, field, cleaned)
-                    except Exception:
-                        pass
-                else:
-                    try:
-                        setattr(p, field, '')
-                    except Exception:
-                        pass
-    except TypeError:
-        # products may not be iterable in some edge cases; ignore safely
-        pass
-
-    # Cart totals - scope to current user or session
-    session_key = None
-    try:
-        session_key = request.session.session_key
-    except Exception:
-        session_key = None
-
-    if request.user and request.user.is_authenticated:
-        cart_qs = cartOrder.objects.filter(owner=request.user)
-    else:
-        if not session_key:
-            try:
-                request.session.create()
-                session_key = request.session.session_key
-            except Exception:
-                session_key = None
-        cart_qs = cartOrder.objects.filter(session_key=session_key) if session_key else cartOrder.objects.none()
-
-    cartProducts = cart_qs.annotate(
-        total_price=ExpressionWrapper(F('price') * F('quantity'), output_field=DecimalField())
-    )
-    subtotal = sum(item.price * item.quantity for item in cartProducts)
-    taxes = subtotal * Decimal('0.15')
-    total = subtotal + taxes
-
-    # Orders - scope to current user or session
-    if request.user and request.user.is_authenticated:
-        orders = Order.objects.filter(owner=request.user).order_by('-date')
-    else:
-        orders = Order.objects.filter(session_key=session_key).order_by('-date') if session_key else Order.objects.none()
-    # Try to attach a product_id attribute to orders when possible.
-    # We avoid changing the DB schema now; instead, perform a best-effort lookup
-    # by matching the order.product string to an existing Product name.
-    try:
-        for o in orders:
-            o.product_id = None
-            try:
-                # First try exact match
-                prod = Product.objects.filter(name__iexact=o.product).first()
-                if not prod:
-                    # Fallback: partial match on name or brand_model
-                    prod = Product.objects.filter(Q(name__icontains=o.product) | Q(brand_model__icontains=o.product)).first()
-                if prod:
-                    o.product_id = prod.id
-            except Exception:
-                # If anything goes wrong, leave product_id as None
-                o.product_id = None
-    except Exception:
-        # If orders is not iterable for some reason, ignore and continue
-        pass
-    total_price = sum(order.total for order in orders)
-    today_date = timezone.now().strftime("%B %d, %Y")
-
-    context = {
-        'products': products,
-        'date': datetime.now().strftime("%B %d, %Y"),
-        'current_search': search_query,
-        'current_filter': filter_query,
-
-        'cartProducts': cartProducts,
-        'cart_items': cartProducts,
-        'subtotal': "%.2f" % subtotal,
-        'taxes': "%.2f" % taxes,
-        'total': "%.2f" % total,
-
-        'orders': orders,
-        'total_price': total_price,
-        'today_date': today_date,
-    }
-
-    # Add bundles to context
-    bundles = Bundle.objects.all().order_by('-created_at')[:6]
-    context['bundles'] = bundles
+    context = build_home_context(request)
 
     # Optional: allow opening a product detail inline on the home page
     # Optional: allow opening a product detail inline on the home page.
@@ -402,10 +263,7 @@ def home(request):
     if product_view_session_id:
         try:
             pv = Product.objects.get(pk=product_view_session_id)
-            related_products = Product.objects.filter(category=pv.category).exclude(id=pv.id)[:4]
-            context['product'] = pv
-            context['related_products'] = related_products
-            context['show_product_container'] = True
+            context.update(product_detail_context(pv))
         except Product.DoesNotExist:
             pass
 
@@ -415,39 +273,11 @@ def home(request):
         if product_view_id:
             try:
                 pv = Product.objects.get(pk=product_view_id)
-                related_products = Product.objects.filter(category=pv.category).exclude(id=pv.id)[:4]
-                context['product'] = pv
-                context['related_products'] = related_products
-                context['show_product_container'] = True
+                context.update(product_detail_context(pv))
             except Product.DoesNotExist:
                 pass
 
-    # If a single product is being shown (product detail inline), ensure its fields are cleaned too
-    if context.get('product'):
-        p = context['product']
-        def _is_meaningful_local(v):
-            try:
-                s = str(v).strip()
-            except Exception:
-                return False
-            if s == '':
-                return False
-            return s.lower() not in {'na', 'n/a', 'none', 'null', '-', 'unknown'}
-
-        for field in ['brand_model', 'brand', 'color', 'storage_ram', 'network', 'battery', 'camera', 'screen', 'processor', 'os', 'accessories', 'condition', 'warranty', 'location', 'optional_details', 'description']:
-            val = getattr(p, field, None)
-            if _is_meaningful_local(val):
-                try:
-                    setattr(p, field, str(val).strip())
-                except Exception:
-                    pass
-            else:
-                try:
-                    setattr(p, field, '')
-                except Exception:
-                    pass
-
-    return render(request, 'website/home.html', context)
+    return render_storefront(request, context)
 
 
 # ---------------- CART QUANTITY UPDATE ---------------- #
@@ -459,41 +289,18 @@ def update_cart_quantity(request):
     
     try:
         # Scope lookup by user or session
-        session_key = None
-        try:
-            session_key = request.session.session_key
-        except Exception:
-            session_key = None
-
-        if request.user and request.user.is_authenticated:
-            cart_item = cartOrder.objects.get(product_id=product_id, owner=request.user)
-        else:
-            if not session_key:
-                try:
-                    request.session.create()
-                    session_key = request.session.session_key
-                except Exception:
-                    session_key = None
-            cart_item = cartOrder.objects.get(product_id=product_id, session_key=session_key)
+        cart_items = cart_queryset(request, create_session=True)
+        cart_item = cart_items.get(product_id=product_id)
 
         cart_item.quantity = quantity
         cart_item.save()
 
         # Recompute scoped totals
-        if request.user and request.user.is_authenticated:
-            cart_items = cartOrder.objects.filter(owner=request.user)
-        else:
-            cart_items = cartOrder.objects.filter(session_key=session_key) if session_key else cartOrder.objects.none()
-
-        subtotal = sum(item.price * item.quantity for item in cart_items)
-        taxes = subtotal * Decimal('0.15')
-        total = subtotal + taxes
+        totals = cart_totals(cart_items)
 
         return JsonResponse({
             'success': True,
-            'subtotal': "%.2f" % subtotal,
-            'taxes': "%.2f" % taxes,
-            'total': "%.2f" % total,
+            **format_totals(totals),
             'item_total': "%.2f" % (cart_item.price * cart_item.quantity),
         })
     except cartOrder.DoesNotExist:
@@ -503,27 +310,33 @@ def update_cart_quantity(request):
 # ---------------- API ENDPOINTS ---------------- #
 
 @api_view(['GET'])
+@cache_catalog_response('live_search')
 def live_search_products(request):
     query = request.GET.get('search', '')
+    fast = FastProductSerializer(request, requested_fields(request, ProductSerializer))
     products = Product.objects.all()
     if query:
-        products = products.filter(
-            Q(name__icontains=query) |
-            Q(brand_model__icontains=query) |
-            Q(optional_details__icontains=query) |
-            Q(category__icontains=query) |
-            Q(color__icontains=query)
-        )
-    serializer = ProductSerializer(products, many=True, context={'request': request})
-    return Response(serializer.data)
+        products = search.filter_products(products, query)
+    return Response(fast.serialize(fast.values(products)))
+
+
+def suggest_products(request):
+    """Typeahead: the top few ``{id, name, thumbnail, price}`` for ``?q=``, from memory."""
+    try:
+        limit = min(int(request.GET.get('limit', suggest.DEFAULT_LIMIT)), suggest.MAX_LIMIT)
+    except ValueError:
+        limit = suggest.DEFAULT_LIMIT
+    return JsonResponse(suggest.index.suggest(request.GET.get('q', ''), max(limit, 1)), safe=False)
 
 
+@conditional(bundles_etag)
 @api_view(['GET', 'POST'])
+@cache_catalog_response('bundles')
 def bundles_list_create(request):
     if request.method == 'GET':
-        bundles = Bundle.objects.all().order_by('-created_at')
-        serializer = BundleSerializer(bundles, many=True, context={'request': request})
-        return Response(serializer.data)
+        fast = FastBundleSerializer(request, requested_fields(request, BundleSerializer),
+                                    nested_fields=nested_product_fields(request))
+        return Response(fast.serialize(fast.values(Bundle.objects.order_by('-created_at'))))
     else:
         # Accept both JSON and multipart/form-data where 'products' may be provided as
         # a JSON list in a 'products' field or as repeated form fields. Normalize it first.
@@ -548,62 +361,33 @@ def bundles_list_create(request):
 
         serializer = BundleSerializer(data=data)
         if serializer.is_valid():
-            # Save with an enhanced retry loop to handle transient sqlite locking errors.
-            # Use exponential backoff and ensure the DB connection is closed/rolled back
-            # between attempts to clear any leftover locks.
-            max_attempts = 8
-            attempt = 0
-            bundle = None
-            from django.db import DatabaseError, connection, transaction
-            import time
-            while attempt < max_attempts:
-                try:
-                    # Use atomic to ensure partial writes are not left open
-                    with transaction.atomic():
-                        bundle = serializer.save()
-                    break
-                except DatabaseError as e:
-                    msg = str(e).lower()
-                    if 'locked' in msg or 'database is locked' in msg:
-                        attempt += 1
-                        # exponential backoff: 0.1, 0.2, 0.4, ... capped at ~2s
-                        sleep_time = min(0.1 * (2 ** (attempt - 1)), 2.0)
-                        try:
-                            time.sleep(sleep_time)
-                        except Exception:
-                            pass
-                        # ensure connection is clean for next try
-                        try:
-                            if connection.in_atomic_block:
-                                # rollback any open transaction
-                                transaction.set_rollback(True)
-                        except Exception:
-                            pass
-                        try:
-                            connection.close()
-                        except Exception:
-                            pass
-                        continue
-                    # re-raise for other DB errors
+            # The write queue (website/sqlite.py) serializes writers, so this
+            # only fails if the lock is held for longer than the DB timeout
+            try:
+                with transaction.atomic():
+                    bundle = serializer.save()
+                    # If products included, ensure M2M relationship is set
+                    if 'products' in serializer.validated_data:
+                        bundle.products.set(serializer.validated_data.get('products', []))
+            except OperationalError as e:
+                if 'locked' not in str(e).lower():
                     raise
-            if bundle is None:
                 return Response({'detail': 'Database is locked, please try again.'}, status=503)
-            # If products included, ensure M2M relationship is set
-            if 'products' in serializer.validated_data:
-                bundle.products.set(serializer.validated_data.get('products', []))
             return Response(BundleSerializer(bundle, context={'request': request}).data, status=201)
         return Response(serializer.errors, status=400)
 
 
 @api_view(['GET', 'PUT', 'PATCH', 'DELETE'])
 def bundle_detail(request, pk):
+    nested_fields = nested_product_fields(request)
     try:
-        bundle = Bundle.objects.get(pk=pk)
+        bundle = bundle_queryset(nested_fields and nested_fields['product_details']).get(pk=pk)
     except Bundle.DoesNotExist:
         return Response({'detail': 'Not found'}, status=404)
 
     if request.method == 'GET':
-        serializer = BundleSerializer(bundle, context={'request': request})
+        serializer = BundleSerializer(bundle, fields=requested_fields(request, BundleSerializer),
+                                      nested_fields=nested_fields, context={'request': request})
         return Response(serializer.data)
     if request.method in ['PUT', 'PATCH']:
         data = request.data.copy()
@@ -691,28 +475,7 @@ def update_order_status(request, pk):
     try:
         order.save()
         serializer = OrderSerializer(order, context={'request': request})
-
-        # Best-effort broadcast to websocket group 'site_updates'
-        try:
-            from asgiref.sync import async_to_sync
-            from channels.layers import get_channel_layer
-
-            channel_layer = get_channel_layer()
-            if channel_layer is not None:
-                async_to_sync(channel_layer.group_send)(
-                    'site_updates',
-                    {
-                        'type': 'site_update',
-                        'data': {
-                            'order_id': order.id,
-                            'delivery_status': order.delivery_status,
-                        }
-                    }
-                )
-        except Exception:
-            # Non-fatal: continue even if broadcast fails
-            pass
-
+        # The Order post_save signal notifies websocket clients of the new status
         return Response(serializer.data)
     except Exception as e:
         return Response({'detail': str(e)}, status=500)
@@ -768,14 +531,14 @@ def remove_order(request):
         return JsonResponse({'success': False, 'message': 'Failed to remove order'}, status=500)
 
 
+@conditional(products_etag)
 @api_view(['GET'])
+@cache_catalog_response('products')
 def get_products(request):
-    products = Product.objects.all().order_by('-id')
-    paginator = PageNumberPagination()
-    paginator.page_size = 6
-    result_page = paginator.paginate_queryset(products, request)
-    serializer = ProductSerializer(result_page, many=True, context={'request': request})
-    return paginator.get_paginated_response(serializer.data)
+    fast = FastProductSerializer(request, requested_fields(request, ProductSerializer))
+    paginator = KeysetPagination()
+    result_page = paginator.paginate_queryset(fast.values(Product.objects.all()), request)
+    return paginator.get_paginated_response(fast.serialize(result_page))
 
 
 @api_view(['DELETE'])
@@ -791,10 +554,8 @@ def delete_product(request, pk):
 # ---------------- PRODUCT DASHBOARD ---------------- #
 
 def product_dashboard(request):
-    product_list = Product.objects.all()
-    paginator = Paginator(product_list, 6)
-    page_number = request.GET.get("page")
-    products = paginator.get_page(page_number)
+    cursor = decode_cursor(request.GET.get(CURSOR_PARAM))
+    products = paginate(Product.objects.all(), cursor)
     return render(request, "your_template.html", {"products": products})
 
 
@@ -813,6 +574,24 @@ class ProductCreateView(APIView):
 
 # ---------------- PLACE ORDER ---------------- #
 
+def order_scope_kwargs(request):
+    """Attach owner or session_key to new orders for scoping."""
+    try:
+        if request.user and request.user.is_authenticated:
+            return {'owner': request.user}
+        if not request.session.session_key:
+            request.session.save()
+        return {'session_key': request.session.session_key}
+    except Exception:
+        return {}
+
+
+@staff_member_required
+def db_stats(request):
+    """Connection reuse counters for this worker process (see db_metrics)."""
+    return JsonResponse(db_metrics.snapshot())
+
+
 @csrf_exempt
 @api_view(['POST'])
 def place_order(request):
@@ -829,6 +608,15 @@ def place_order(request):
         if not cart_items:
             return JsonResponse({'error': 'Cart is empty'}, status=400)
 
+        order_number = Order.make_order_number()
+        scope = order_scope_kwargs(request)
+        try:
+            # These cart items carry only the product name
+            product_ids = match_product_ids(item.get('name') or '' for item in cart_items)
+        except Exception:
+            logger.exception('Failed to resolve order products')
+            product_ids = {}
+        orders = []
         for item in cart_items:
             quantity = item.get('qty')
             price = item.get('price')
@@ -837,28 +625,23 @@ def place_order(request):
                 continue
 
             total = quantity * price
-            # Attach owner or session_key to the order for scoping
-            order_kwargs = {
-                'first_name': first_name,
-                'last_name': last_name,
-                'phone_number': phone_number,
-                'location': location,
-                'product': product_name,
-                'quantity': quantity,
-                'price': price,
-                'total': total,
-            }
-            try:
-                if request.user and request.user.is_authenticated:
-                    order_kwargs['owner'] = request.user
-                else:
-                    if not request.session.session_key:
-                        request.session.save()
-                    order_kwargs['session_key'] = request.session.session_key
-            except Exception:
-                pass
-
-            Order.objects.create(**order_kwargs)
+            orders.append(Order(
+                first_name=first_name,
+                last_name=last_name,
+                phone_number=phone_number,
+                location=location,
+                product=product_name,
+                product_ref_id=product_ids.get(product_name.lower()),
+                quantity=quantity,
+                price=price,
+                total=total,
+                order_number=order_number,
+                **scope,
+            ))
+
+        with transaction.atomic():
+            created = Order.objects.bulk_create(orders)
+            broadcast_orders_placed(created)
 
         return JsonResponse({'status': 'success'}, status=200)
 
@@ -950,10 +733,7 @@ def addProduct_to_cart(request):
                     pass
                 existing.save()
                 # compute scoped total
-                if request.user.is_authenticated:
-                    total_items = sum(item.quantity for item in cartOrder.objects.filter(owner=request.user))
-                else:
-                    total_items = sum(item.quantity for item in cartOrder.objects.filter(session_key=request.session.session_key))
+                total_items = cart_totals(cart_queryset(request))['total_items']
                 return JsonResponse({'success': True, 'message': 'Product Successfully updated in cart.', 'product_id': pid_int, 'quantity': existing.quantity, 'cart_count': total_items})
 
             # Create new cart item if not existing. Attach owner or session_key for scoping.
@@ -974,12 +754,17 @@ def addProduct_to_cart(request):
                     request.session.save()
                 kwargs['session_key'] = request.session.session_key
 
-            cartOrder.objects.create(**kwargs)
-            if request.user.is_authenticated:
-                total_items = sum(item.quantity for item in cartOrder.objects.filter(owner=request.user))
-            else:
-                total_items = sum(item.quantity for item in cartOrder.objects.filter(session_key=request.session.session_key))
-            return JsonResponse({'success': True, 'message': 'Product added to cart.', 'product_id': pid_int, 'quantity': 1, 'cart_count': total_items})
+            try:
+                with transaction.atomic():
+                    cartOrder.objects.create(**kwargs)
+                quantity = 1
+            except IntegrityError:
+                # A concurrent request created the row first (one row per product per visitor)
+                row = cart_queryset(request).filter(product_id=pid_int)
+                row.update(quantity=F('quantity') + 1, price=price_decimal, updated_at=timezone.now())
+                quantity = row.values_list('quantity', flat=True).first() or 1
+            total_items = cart_totals(cart_queryset(request))['total_items']
+            return JsonResponse({'success': True, 'message': 'Product added to cart.', 'product_id': pid_int, 'quantity': quantity, 'cart_count': total_items})
         except Exception as e:
             return JsonResponse({'success': False, 'message': f'Error: {str(e)}'}, status=500)
 
@@ -987,70 +772,22 @@ def addProduct_to_cart(request):
 
 # ---------------- CART API ---------------- #
 
+@conditional(cart_etag, private=True)
 def cart_api(request):
     # Scope cart items to current user or session
-    if request.user.is_authenticated:
-        cart_items_qs = cartOrder.objects.filter(owner=request.user)
-    else:
-        if not request.session.session_key:
-            request.session.save()
-        cart_items_qs = cartOrder.objects.filter(session_key=request.session.session_key)
-
-    cart_items = cart_items_qs.annotate(
-        total_price=ExpressionWrapper(F('price') * F('quantity'), output_field=DecimalField())
-    )
-    subtotal = Decimal('0')
-    items_list = []
-    for item in cart_items:
-        # Build an absolute URL for the image when possible so front-end can use it directly
-        img_url = ''
-        try:
-            if item.image:
-                if item.image.startswith('http://') or item.image.startswith('https://'):
-                    img_url = item.image
-                else:
-                    # item.image is stored as a media-relative path like 'products/123.jpg'
-                    media_prefix = settings.MEDIA_URL if getattr(settings, 'MEDIA_URL', '/') else '/media/'
-                    img_url = request.build_absolute_uri('/' + media_prefix.lstrip('/') + item.image.lstrip('/'))
-        except Exception:
-            img_url = item.image or ''
-
-        items_list.append({
-            'product_id': item.product_id,
-            'name': item.name,
-            'quantity': item.quantity,
-            'price': float(item.price),
-            'total_price': float(item.total_price),
-            'image': img_url,
-            'condition': item.condition or '',
-            'category': item.category or '',
-        })
-        subtotal += item.price * item.quantity
-        
-    subtotal = subtotal / Decimal(1.15)
-    taxes = subtotal * Decimal(0.15)
-    total = subtotal + taxes
-
-    return JsonResponse({
-        'cart_items': items_list,
-        'subtotal': f"{subtotal:.2f}",
-        'taxes': f"{taxes:.2f}",
-        'total': f"{total:.2f}",
-        'total_items': sum(item['quantity'] for item in items_list),
-    })
+    if not request.user.is_authenticated and not request.session.session_key:
+        request.session.save()
+    return JsonResponse(cart_payload(request, list(with_line_totals(cart_queryset(request)))))
 
 
 # ---------------- CHECKOUT ---------------- #
 
 def checkout(request):
     # Scope cart items to current user or session
-    if request.user.is_authenticated:
-        cart_items = cartOrder.objects.filter(owner=request.user)
-    else:
-        if not request.session.session_key:
-            request.session.save()
-        cart_items = cartOrder.objects.filter(session_key=request.session.session_key)
-    subtotal = sum(item.price * item.quantity for item in cart_items)
+    if not request.user.is_authenticated and not request.session.session_key:
+        request.session.save()
+    cart_items = cart_queryset(request)
+    subtotal = cart_totals(cart_items)['subtotal']
 
     # Default values
     delivery_cost = 0
@@ -1127,7 +864,12 @@ def checkout(request):
         # Add delivery cost to total
         total = subtotal + delivery_cost
 
-        # Create orders
+        # Build all order lines first, then write them in one transaction
+        order_number = Order.make_order_number()
+        scope = order_scope_kwargs(request)
+        # Cart rows keep the product id even after the product is deleted
+        existing = set(Product.objects.filter(pk__in=cart_items.values('product_id')).values_list('pk', flat=True))
+        orders = []
         for item in cart_items:
             # Normalize cart item image into a media-relative path for Order.image
             ord_img = ''
@@ -1157,32 +899,23 @@ def checkout(request):
                 'location': address,
                 'delivery_notes': notes,
                 'product': item.name,
+                'product_ref_id': item.product_id if item.product_id in existing else None,
                 'quantity': item.quantity,
                 'price': item.price,
                 'total': item.price * item.quantity,
                 'image': ord_img,
-                'delivery_cost': delivery_cost
+                'delivery_cost': delivery_cost,
+                'order_number': order_number,
             }
-            try:
-                if request.user and request.user.is_authenticated:
-                    order_kwargs['owner'] = request.user
-                else:
-                    if not request.session.session_key:
-                        request.session.save()
-                    order_kwargs['session_key'] = request.session.session_key
-            except Exception:
-                pass
-
-            Order.objects.create(**order_kwargs)
-        # Clear cart for current user/session only
-        if request.user and request.user.is_authenticated:
-            cartOrder.objects.filter(owner=request.user).delete()
-        else:
-            if request.session.session_key:
-                cartOrder.objects.filter(session_key=request.session.session_key).delete()
-            else:
-                # nothing to delete if session unknown
-                pass
+            order_kwargs.update(scope)
+            orders.append(Order(**order_kwargs))
+
+        with transaction.atomic():
+            created = Order.objects.bulk_create(orders)
+            # Clear cart for current user/session only
+            clear_cart(cart_items)
+            # One event for the orders and one for the cart, sent once the rows are committed
+            broadcast_orders_placed(created)
         return redirect("home")
 
     # GET request: show checkout page
@@ -1199,103 +932,25 @@ from .models import Product
 
 def product_detail(request, product_id):
     product = get_object_or_404(Product, id=product_id)
-    related_products = Product.objects.filter(category=product.category).exclude(id=product.id)[:4]
-
-    # Call the home view to get its response
-    home_response = home(request)
-    
-    # The context is in the 'context_data' attribute of the response if it's a TemplateResponse,
-    # but render() returns an HttpResponse. We need to rebuild the context.
-    # A better long-term solution is to refactor context creation into a helper function.
-    # For now, let's just get the context from the home view's response if possible, or rebuild it.
-    
-    # Let's rebuild the context needed from home()
-    search_query = request.GET.get('search', '')
-    filter_query = request.GET.get('filter', '')
-
-    product_list = Product.objects.all().order_by('-id')
-
-    if filter_query and filter_query.lower() != "all":
-        product_list = product_list.filter(category__icontains=filter_query)
-
-    if search_query:
-        product_list = product_list.filter(
-            Q(name__icontains=search_query) |
-            Q(brand_model__icontains=search_query) |
-            Q(optional_details__icontains=search_query) |
-            Q(category__icontains=search_query) |
-            Q(color__icontains=search_query)
-        )
-
-    paginator = Paginator(product_list, 6)
-    page_number = request.GET.get("page")
-    products = paginator.get_page(page_number)
-
-    # Cart totals - scope to current user/session
-    session_key = None
-    try:
-        session_key = request.session.session_key
-    except Exception:
-        session_key = None
 
-    if request.user and request.user.is_authenticated:
-        cart_qs = cartOrder.objects.filter(owner=request.user)
-    else:
-        if not session_key:
-            try:
-                request.session.create()
-                session_key = request.session.session_key
-            except Exception:
-                session_key = None
-        cart_qs = cartOrder.objects.filter(session_key=session_key) if session_key else cartOrder.objects.none()
+    # Same storefront context as home(), plus the product detail panel
+    context = build_home_context(request)
+    context.update(product_detail_context(product))
 
-    cartProducts = cart_qs.annotate(
-        total_price=ExpressionWrapper(F('price') * F('quantity'), output_field=DecimalField())
-    )
-    subtotal = sum(item.price * item.quantity for item in cartProducts)
-    taxes = subtotal * Decimal('0.15')
-    total = subtotal + taxes
-
-    # Orders - scope to current user/session
-    if request.user and request.user.is_authenticated:
-        orders = Order.objects.filter(owner=request.user).order_by('-date')
-    else:
-        orders = Order.objects.filter(session_key=session_key).order_by('-date') if session_key else Order.objects.none()
-    total_price = sum(order.total for order in orders)
-    today_date = timezone.now().strftime("%B %d, %Y")
-
-    context = {
-        'products': products,
-        'date': datetime.now().strftime("%B %d, %Y"),
-        'current_search': search_query,
-        'current_filter': filter_query,
-
-        'cartProducts': cartProducts,
-        'cart_items': cartProducts,
-        'subtotal': "%.2f" % subtotal,
-        'taxes': "%.2f" % taxes,
-        'total': "%.2f" % total,
-
-        'orders': orders,
-        'total_price': total_price,
-        'today_date': today_date,
-    }
-    
-    # Add product-specific details to the context
-    context['product'] = product
-    context['related_products'] = related_products
-    context['show_product_container'] = True # Flag to display the product detail section
-
-    return render(request, 'website/home.html', context)
+    return render_storefront(request, context)
 
+@conditional(product_detail_etag)
 @api_view(['GET'])
+@cache_catalog_response('product_detail')
 def get_product_detail(request, pk):
+    fields = requested_fields(request, ProductSerializer)
     try:
-        product = Product.objects.get(pk=pk)
+        # category is needed below for the related products
+        product = product_queryset(fields, extra=('category',)).get(pk=pk)
     except Product.DoesNotExist:
         return Response({'detail': 'Not found'}, status=404)
 
-    related = Product.objects.filter(category=product.category).exclude(id=product.id)[:4]
-    product_data = ProductSerializer(product, context={'request': request}).data
-    related_data = ProductSerializer(related, many=True, context={'request': request}).data
+    related = product_queryset(fields).filter(category=product.category).exclude(id=product.id)[:4]
+    product_data = ProductSerializer(product, fields=fields, context={'request': request}).data
+    related_data = ProductSerializer(related, many=True, fields=fields, context={'request': request}).data
     return Response({'product': product_data, 'related': related_data})